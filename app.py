@@ -1,12 +1,151 @@
-from flask import Flask, render_template, request, jsonify
-from models.prediction_engine import train_and_predict, get_market_summary
-from chat.llm_service import get_chat_response
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
+from models.prediction_engine import train_and_predict
+from models.market_summary import get_market_summary, market_ticker, StreamFullError
+from models.symbol_search import symbol_search
+from models.job_queue import JobQueue, QueueFullError
+from models.batch import predict_batch, BATCH_MAX_TICKERS
+from models.backends import warm_up, loaded_backends, MODEL_WARMUP
+from models.runtime import thread_budget
+from models.payload import shape_payload
+from models.backtest import run_backtest
+from models.sweep import run_sweep, SEARCHES
+from chat.llm_service import get_chat_response, stream_chat_response
+from chat.news_service import prefetch_stock_news
+from models import model_registry
+from chat import news_service
+from metrics import registry as metrics_registry, http_request_seconds, profile_call
 import os
-import requests
+import gzip
 import json
+import time
+import threading
 
 app = Flask(__name__)
 SETTINGS_FILE = 'api_settings.json'
+predict_queue = JobQueue(train_and_predict)
+# Sweeps already fan out over the batch process pool, so run one at a time
+sweep_queue = JobQueue(run_sweep, workers=1, max_pending=4)
+# Backtests retrain once per fold, so they run in the background too
+backtest_queue = JobQueue(run_backtest, workers=1, max_pending=8)
+
+# Model backends load on first use; MODEL_WARMUP imports them in the background instead.
+# Started explicitly (see __main__ and serve.py) so a preforking server can do it after the fork.
+_warmed_up = threading.Event()
+_warmup_pid = None
+
+def start_warmup():
+    """Imports the MODEL_WARMUP backends in a background thread, once per process"""
+    global _warmup_pid
+    if _warmup_pid == os.getpid():
+        return
+    _warmup_pid = os.getpid()
+    _warmed_up.clear()
+    if not MODEL_WARMUP:
+        _warmed_up.set()
+        return
+    def run():
+        warm_up()
+        _warmed_up.set()
+    threading.Thread(target=run, name='model-warmup', daemon=True).start()
+
+# Lets a /predict request ask for a cProfile of the run with "profile": true
+PREDICT_PROFILING = os.getenv('PREDICT_PROFILING', '0') == '1'
+# JSON responses above this size are gzipped for clients that accept it (0 = off)
+GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', '2048'))
+
+# --- Metrics ---
+def _hit_rates():
+    stats = model_registry.registry.stats()
+    cache = news_service.news_cache
+    return {
+        (('cache', 'model_registry'), ('result', 'hit')): stats['hits'],
+        (('cache', 'model_registry'), ('result', 'disk_hit')): stats['disk_hits'],
+        (('cache', 'model_registry'), ('result', 'miss')): stats['misses'],
+        (('cache', 'news'), ('result', 'hit')): cache.hits,
+        (('cache', 'news'), ('result', 'miss')): cache.misses,
+        (('cache', 'symbol_search'), ('result', 'local_hit')): symbol_search.local_hits,
+        (('cache', 'symbol_search'), ('result', 'hit')): symbol_search.cache_hits,
+        (('cache', 'symbol_search'), ('result', 'miss')): symbol_search.upstream_calls,
+    }
+
+metrics_registry.add_collector('cache_requests_total', 'Cache lookups by cache and result', _hit_rates, 'counter')
+metrics_registry.add_collector('model_registry_entries', 'Trained models held in memory',
+                               lambda: model_registry.registry.stats()['entries'])
+metrics_registry.add_collector('model_registry_bytes', 'Approximate size of the in-memory models',
+                               lambda: model_registry.registry.stats()['bytes'])
+metrics_registry.add_collector('predict_jobs_pending', 'Queued or running prediction jobs', predict_queue.pending)
+metrics_registry.add_collector('backtest_jobs_pending', 'Queued or running backtest jobs', backtest_queue.pending)
+metrics_registry.add_collector('market_stream_subscribers', 'Open market summary streams',
+                               lambda: market_ticker.subscribers)
+metrics_registry.add_collector('market_stream_broadcasts_total', 'Market summary updates broadcast',
+                               lambda: market_ticker.broadcasts, 'counter')
+metrics_registry.add_collector('market_stream_resets_total', 'Slow stream subscribers reset to a snapshot',
+                               lambda: market_ticker.resets, 'counter')
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+@app.before_request
+def ensure_warmup():
+    # Covers servers that load the app without calling start_warmup in the worker
+    # (gunicorn app:app, or create_app(preload=True) without --preload); a no-op once started
+    start_warmup()
+
+@app.after_request
+def record_request(response):
+    # Streamed responses are timed until the headers go out, not until the stream ends
+    start = g.get('start_time')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_seconds.observe(time.perf_counter() - start, endpoint=endpoint,
+                                     method=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def compress_response(response):
+    if (not GZIP_MIN_BYTES or response.direct_passthrough or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 until this process has warmed up, or while its job queue is full"""
+    pending = predict_queue.pending()
+    status = {
+        'ready': _warmed_up.is_set() and pending < predict_queue.max_pending,
+        'pid': os.getpid(),
+        'backends': loaded_backends(),
+        'threads': thread_budget(),
+        'pending_jobs': pending,
+    }
+    return jsonify(status), 200 if status['ready'] else 503
+
+def with_timings(result, include):
+    """Results are shared between callers of the same job, so drop timings from a copy"""
+    if include or not isinstance(result, dict) or 'timings' not in result:
+        return result
+    return {k: v for k, v in result.items() if k != 'timings'}
+
+def present_result(result, options):
+    """Applies the response options (timings, since, max_points, format) of a request"""
+    result = with_timings(result, str(options.get('timings', '')).lower() in ('1', 'true'))
+    max_points = options.get('max_points')
+    return shape_payload(result, since=options.get('since') or None,
+                         max_points=int(max_points) if max_points else None,
+                         fmt=options.get('format') or 'json')
 
 @app.route('/')
 def index():
@@ -19,22 +158,8 @@ def search_ticker():
         return jsonify([])
     
     try:
-        # Yahoo Finance Autocomplete API
-        url = f"https://query2.finance.yahoo.com/v1/finance/search?q={query}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers)
-        data = response.json()
-        
-        results = []
-        if 'quotes' in data:
-            for quote in data['quotes']:
-                if 'symbol' in quote:
-                    results.append({
-                        'symbol': quote['symbol'],
-                        'name': quote.get('shortname', quote.get('longname', 'N/A')),
-                        'exchange': quote.get('exchange', 'N/A')
-                    })
-        return jsonify(results)
+        # Local symbol index first, Yahoo Finance autocomplete (pooled + cached) on a miss
+        return jsonify(symbol_search.search(query))
     except Exception as e:
         print(f"Search error: {e}")
         return jsonify([])
@@ -47,25 +172,186 @@ def market_summary():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/market-summary/stream')
+def market_summary_stream():
+    """Server-sent events: event: snapshot with every quote, then event: update with the changed ones"""
+    try:
+        subscription = market_ticker.subscribe()
+    except StreamFullError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    def generate():
+        try:
+            # Reconnect a few seconds after the stream is closed (MARKET_STREAM_MAX_SECONDS)
+            yield "retry: 3000\n\n"
+            for event, quotes in market_ticker.events(subscription):
+                if event is None:
+                    # Comment line: keeps proxies from timing out and notices clients that left
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: {event}\ndata: {json.dumps(quotes)}\n\n"
+        finally:
+            market_ticker.unsubscribe(subscription)
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+def parse_predict_request(data):
+    ticker = (data.get('ticker') or '').strip().upper()
+    look_back = int(data.get('look_back', 60))
+    forecast_days = int(data.get('forecast_days', 5))
+    model_type = data.get('model_type', 'lstm')
+    forecast_mode = data.get('forecast_mode', 'recursive')
+    tuned = bool(data.get('tuned', False))
+    # Seconds the whole prediction should take; None uses PREDICT_BUDGET_SECONDS
+    budget = float(data['budget']) if data.get('budget') is not None else None
+    return ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget
+
 @app.route('/predict', methods=['POST'])
 def predict():
     data = request.get_json()
-    ticker = data.get('ticker')
+    ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget = parse_predict_request(data)
+    
+    if not ticker:
+        return jsonify({'error': 'Ticker symbol is required'}), 400
+        
+    # Warm the news cache while the model trains, the chat usually asks about it next
+    prefetch_stock_news(ticker)
+    try:
+        if data.get('profile'):
+            if not PREDICT_PROFILING:
+                return jsonify({'error': 'Profiling is disabled (set PREDICT_PROFILING=1).'}), 403
+            # Profiled runs bypass the queue so the profile only covers this request
+            result, profile = profile_call(train_and_predict, ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget)
+            if 'error' in result:
+                return jsonify({'error': result['error']}), 400
+            return jsonify(dict(present_result(result, data), profile=profile))
+        
+        # Runs through the job queue so identical concurrent requests share one training
+        job = predict_queue.run(ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget)
+        if job.status == 'failed':
+             return jsonify({'error': job.error}), 400
+        return jsonify(present_result(job.result, data))
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/jobs', methods=['POST'])
+def submit_predict_job():
+    data = request.get_json()
+    ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget = parse_predict_request(data)
+    
+    if not ticker:
+        return jsonify({'error': 'Ticker symbol is required'}), 400
+        
+    prefetch_stock_news(ticker)
+    try:
+        job = predict_queue.submit(ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget)
+        return jsonify(job.to_dict(include_result=False)), 202
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+
+@app.route('/predict/jobs/<job_id>')
+def predict_job_status(job_id):
+    job = predict_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    data = job.to_dict()
+    if 'result' in data:
+        try:
+            data['result'] = present_result(data['result'], request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(data)
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch_route():
+    """Streams one JSON line per ticker (NDJSON) as each prediction finishes"""
+    data = request.get_json()
+    tickers = data.get('tickers') or []
     look_back = int(data.get('look_back', 60))
     forecast_days = int(data.get('forecast_days', 5))
     model_type = data.get('model_type', 'lstm')
+    forecast_mode = data.get('forecast_mode', 'recursive')
+    
+    if not isinstance(tickers, list) or not tickers:
+        return jsonify({'error': 'A list of tickers is required'}), 400
+        
+    if len(tickers) > BATCH_MAX_TICKERS:
+        return jsonify({'error': f'At most {BATCH_MAX_TICKERS} tickers can be predicted per batch.'}), 400
+    
+    # The pool is shared and sized by BATCH_WORKERS, clients cannot resize it
+    results = predict_batch(tickers, look_back, forecast_days, model_type, forecast_mode)
     
+    def generate():
+        for result in results:
+            yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/backtest', methods=['POST'])
+def submit_backtest():
+    """Starts a walk-forward backtest of one ticker; poll /backtest/jobs/<id> for per-fold and aggregate errors"""
+    data = request.get_json()
+    ticker = (data.get('ticker') or '').strip().upper()
     if not ticker:
         return jsonify({'error': 'Ticker symbol is required'}), 400
-        
+    
     try:
-        result = train_and_predict(ticker, look_back, forecast_days, model_type)
-        if 'error' in result:
-             return jsonify(result), 400
-        return jsonify(result)
+        options = [int(data[key]) if data.get(key) else None for key in ('n_folds', 'test_size', 'train_size')]
+        job = backtest_queue.submit(ticker, int(data.get('look_back', 60)), data.get('model_type', 'linear'),
+                                    data.get('scheme', 'expanding'), *options)
+        return jsonify(job.to_dict(include_result=False)), 202
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/backtest/jobs/<job_id>')
+def backtest_job_status(job_id):
+    job = backtest_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/sweep', methods=['POST'])
+def submit_sweep():
+    """Starts a hyperparameter sweep; the best configuration is used by predictions sent with tuned: true"""
+    data = request.get_json()
+    ticker = (data.get('ticker') or '').strip().upper()
+    search = data.get('search', 'grid')
+    if not ticker:
+        return jsonify({'error': 'Ticker symbol is required'}), 400
+    if search not in SEARCHES:
+        return jsonify({'error': f"Unknown search '{search}'."}), 400
+    
+    try:
+        job = sweep_queue.submit(ticker, data.get('model_type', 'linear'), search, int(data.get('n_iter', 20)))
+        return jsonify(job.to_dict(include_result=False)), 202
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+
+@app.route('/sweep/jobs/<job_id>')
+def sweep_job_status(job_id):
+    job = sweep_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+def chat_api_key(provider):
+    # Load API keys from settings
+    api_keys = load_api_keys()
+    if provider == 'openai':
+        return api_keys.get('openai_api_key', '')
+    elif provider == 'gemini':
+        return api_keys.get('gemini_api_key', '')
+    return None
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.get_json()
@@ -77,20 +363,37 @@ def chat():
     if not message:
         return jsonify({'error': 'Message is required'}), 400
     
-    # Load API keys from settings
-    api_keys = load_api_keys()
-    api_key = None
-    if provider == 'openai':
-        api_key = api_keys.get('openai_api_key', '')
-    elif provider == 'gemini':
-        api_key = api_keys.get('gemini_api_key', '')
-    
+    api_key = chat_api_key(provider)
     if not api_key:
-        return jsonify({'error': f'Please configure your {provider.upper()} API key in settings first.'}), 400
+        return jsonify({'error': f'Please configure your {(provider or "").upper()} API key in settings first.'}), 400
         
     response = get_chat_response(provider, message, context, api_key, model)
     return jsonify({'response': response})
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Relays the reply as server-sent events: data: {"delta": ...} per piece, then event: done"""
+    data = request.get_json()
+    provider = data.get('provider')
+    model = data.get('model')
+    message = data.get('message')
+    context = data.get('context')
+    
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    api_key = chat_api_key(provider)
+    if not api_key:
+        return jsonify({'error': f'Please configure your {(provider or "").upper()} API key in settings first.'}), 400
+    
+    def generate():
+        for event in stream_chat_response(provider, message, context, api_key, model):
+            yield f"data: {json.dumps(event)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
 @app.route('/settings', methods=['GET'])
 def get_settings():
     """Get current API key settings"""
@@ -141,4 +444,5 @@ def save_api_keys(api_keys):
         json.dump(api_keys, f)
 
 if __name__ == '__main__':
+    start_warmup()
     app.run(debug=True, port=5000)
@@ -0,0 +1,246 @@
+"""
+Offline benchmarks for the prediction pipeline.
+
+Runs without network access: the price history comes from a synthetic
+random walk or a recorded OHLCV CSV and is injected in place of the
+yfinance-backed get_stock_data. Each case records wall time, peak Python
+memory and throughput, and the results are written to a JSON file that
+can be compared against a previous run.
+
+    python -m benchmarks.bench_pipeline --quick
+    python -m benchmarks.bench_pipeline --models linear,xgboost --lengths 1250,5000
+    python -m benchmarks.bench_pipeline --output new.json --baseline old.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+import pandas as pd
+
+from models import prediction_engine
+from models.model_registry import ModelRegistry
+from models.indicators import engine as indicator_engine
+
+DEFAULT_MODELS = ['linear', 'random_forest', 'xgboost', 'lstm', 'gru']
+
+
+# --- Fixtures ---
+def synthetic_ohlcv(length, seed=42):
+    """Geometric random walk with plausible OHLCV columns on business days ending today"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, size=length)))
+    open_ = close * (1 + rng.normal(0, 0.003, size=length))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, size=length)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, size=length)))
+    volume = rng.integers(1_000_000, 50_000_000, size=length).astype(np.float64)
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=length, name='Date')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+
+def recorded_ohlcv(path, length):
+    """Loads a recorded CSV (Date index + OHLCV) and repeats it if more bars are requested"""
+    df = pd.read_csv(path, index_col=0, parse_dates=True)[['Open', 'High', 'Low', 'Close', 'Volume']]
+    if len(df) < length:
+        df = pd.concat([df] * (length // len(df) + 1))
+    df = df.iloc[-length:].copy()
+    df.index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=length, name='Date')
+    return df
+
+
+# --- Measurement ---
+def measure(func, repeat, warmup=True):
+    """Returns (best seconds, mean seconds, peak traced MB) over `repeat` runs"""
+    if warmup:
+        # Untimed first call so lazy imports and caches are not billed to the case
+        func()
+    times = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(times), sum(times) / len(times), peak / 1e6
+
+
+def max_rss_mb():
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+    except ImportError:
+        return None
+
+
+def backend_available(model_type):
+    try:
+        prediction_engine.get_backend(model_type)
+        return True
+    except ImportError:
+        return False
+
+
+class InjectedData:
+    """Serves a fixture from get_stock_data instead of the yfinance-backed store"""
+
+    def __init__(self, df):
+        self.df = df
+
+    def __enter__(self):
+        self.previous = prediction_engine.get_stock_data
+        prediction_engine.get_stock_data = lambda ticker, period='5y': self.df
+        return self
+
+    def __exit__(self, *exc):
+        prediction_engine.get_stock_data = self.previous
+
+
+class FreshRegistry:
+    """Points the engine at an empty model registry so every run really trains"""
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix='bench-registry-')
+        self.previous = prediction_engine.registry
+        prediction_engine.registry = ModelRegistry(directory=self.directory)
+        return self
+
+    def __exit__(self, *exc):
+        prediction_engine.registry = self.previous
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# --- Cases ---
+def run_cases(args):
+    results = []
+
+    def record(name, params, func, items=None, repeat=args.repeat):
+        best, mean, peak = measure(func, repeat, warmup=repeat > 1)
+        result = {
+            'benchmark': name,
+            'params': params,
+            'wall_time_s': round(best, 6),
+            'mean_time_s': round(mean, 6),
+            'peak_mem_mb': round(peak, 3),
+            'throughput': round(items / best, 2) if items else None,
+            'throughput_unit': 'windows/s' if items else None,
+        }
+        results.append(result)
+        throughput = f"{result['throughput']:>12,.0f} win/s" if items else ''
+        print(f"{name:<22} {json.dumps(params):<70} {best * 1e3:>10.2f} ms {peak:>8.2f} MB {throughput}")
+
+    models = [m for m in args.models if backend_available(m)]
+    for skipped in sorted(set(args.models) - set(models)):
+        print(f"Skipping {skipped}: backend not installed")
+
+    for length in args.lengths:
+        df = recorded_ohlcv(args.fixture, length) if args.fixture else synthetic_ohlcv(length)
+
+        record('get_recommendation', {'length': length},
+               lambda: prediction_engine.get_recommendation(df))
+        # Incremental path: state is already built, so each call only looks for new bars
+        indicator_engine.update('BENCH', df)
+        record('get_recommendation_ticker', {'length': length},
+               lambda: prediction_engine.get_recommendation(df, 'BENCH'))
+
+        for look_back in args.look_backs:
+            if length <= look_back + max(args.forecast_days):
+                continue
+            windows = length - look_back
+            record('prepare_sequence_data', {'length': length, 'look_back': look_back},
+                   lambda: prediction_engine.prepare_sequence_data(df, look_back), windows)
+            record('prepare_flat_data', {'length': length, 'look_back': look_back},
+                   lambda: prediction_engine.prepare_flat_data(df, look_back), windows)
+
+            for model_type in models:
+                # Deep models are slow, one timed run (and no warm-up) is enough for them
+                repeat = 1 if model_type in prediction_engine.DL_MODELS else args.repeat
+                runner = prediction_engine.run_dl_model if model_type in prediction_engine.DL_MODELS else prediction_engine.run_ml_model
+                for forecast_days in args.forecast_days:
+                    params = {'model': model_type, 'length': length, 'look_back': look_back, 'forecast_days': forecast_days}
+                    record(runner.__name__, params,
+                           lambda: runner(df, look_back, forecast_days, model_type), windows, repeat)
+
+                    def full_pipeline():
+                        with InjectedData(df), FreshRegistry():
+                            prediction_engine.train_and_predict('BENCH', look_back, forecast_days, model_type)
+
+                    record('train_and_predict', params, full_pipeline, windows, repeat)
+    return results
+
+
+# --- Reporting ---
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    previous = {(r['benchmark'], json.dumps(r['params'], sort_keys=True)): r for r in baseline['results']}
+    print(f"\nComparison against {baseline_path} (ratio > 1 means slower now)")
+    for r in results:
+        old = previous.get((r['benchmark'], json.dumps(r['params'], sort_keys=True)))
+        if old and old['wall_time_s']:
+            ratio = r['wall_time_s'] / old['wall_time_s']
+            r['baseline_ratio'] = round(ratio, 3)
+            flag = '  <-- regression' if ratio > 1.2 else ''
+            print(f"{r['benchmark']:<22} {json.dumps(r['params']):<70} {ratio:>6.2f}x{flag}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ints = lambda value: [int(v) for v in value.split(',')]
+    parser.add_argument('--models', type=lambda v: v.split(','), default=DEFAULT_MODELS)
+    parser.add_argument('--look-backs', type=ints, default=[30, 60, 120])
+    parser.add_argument('--lengths', type=ints, default=[1250, 5000])
+    parser.add_argument('--forecast-days', type=ints, default=[5, 30])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fixture', help='recorded OHLCV CSV to use instead of synthetic data')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--quick', action='store_true', help='small grid for a fast smoke run')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.look_backs, args.lengths, args.forecast_days, args.repeat = [60], [1250], [5], 2
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_cases(args)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'max_rss_mb': max_rss_mb(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
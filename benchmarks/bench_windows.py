@@ -0,0 +1,56 @@
+"""
+Before/after benchmark for sliding-window construction.
+
+Compares the original list-append loop against models.windows.build_windows.
+Run from the repository root:
+
+    python -m benchmarks.bench_windows
+"""
+import time
+import tracemalloc
+import numpy as np
+from models.windows import build_windows, as_sequence
+
+
+def loop_windows(values, look_back):
+    """The original prepare_sequence_data loop, kept here as the baseline"""
+    X, y = [], []
+    for i in range(look_back, len(values)):
+        X.append(values[i-look_back:i])
+        y.append(values[i])
+    X, y = np.array(X), np.array(y)
+    return np.reshape(X, (X.shape[0], X.shape[1], 1)), y
+
+
+def strided_windows(values, look_back):
+    X, y = build_windows(values, look_back)
+    return as_sequence(X), y
+
+
+def measure(func, values, look_back, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(values, look_back)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(values, look_back)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    rng = np.random.default_rng(42)
+    print(f"{'length':>8} {'look_back':>9} {'loop ms':>10} {'strided ms':>11} {'speedup':>8} {'loop MB':>9} {'strided MB':>11}")
+    for length in (1_250, 20_000, 200_000):
+        values = 100 + np.cumsum(rng.normal(size=length))
+        for look_back in (60, 240):
+            loop_t, loop_mem = measure(loop_windows, values, look_back)
+            new_t, new_mem = measure(strided_windows, values, look_back)
+            print(f"{length:>8} {look_back:>9} {loop_t * 1e3:>10.2f} {new_t * 1e3:>11.3f} "
+                  f"{loop_t / new_t:>7.0f}x {loop_mem / 1e6:>9.1f} {new_mem / 1e6:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
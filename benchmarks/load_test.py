@@ -0,0 +1,397 @@
+"""
+Load test for the HTTP endpoints with every upstream replaced by a local stand-in.
+
+The app is served in-process (threaded werkzeug) from a scratch working
+directory, so the price store, model registry, symbol file and API settings
+never touch the real ones. Prices, quotes, Yahoo search, news and the LLM are
+answered by stand-ins with configurable latency (seconds) and failure rate,
+given as one value for all of them or per upstream:
+
+    python -m benchmarks.load_test --duration 30 --concurrency 16
+    python -m benchmarks.load_test --mix predict=1,market=5,search=5,chat=1 --latency 0.05,llm=0.5
+    python -m benchmarks.load_test --failure-rate prices=0.1,llm=0.2 --output new.json --baseline old.json
+
+The report lists requests/s and p50/p90/p99 latency per endpoint plus the
+calls each stand-in received; --baseline prints the ratios against an
+earlier report.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import numpy as np
+import requests
+
+from benchmarks.bench_pipeline import synthetic_ohlcv, git_commit, max_rss_mb
+from models.data_store import DataSource, set_data_source
+from chat.news_service import NewsBackend, set_news_backend
+from chat.llm_service import LLMProvider, register_provider
+
+UPSTREAMS = ('prices', 'quotes', 'search', 'news', 'llm')
+DEFAULT_LATENCY = {'prices': 0.3, 'quotes': 0.1, 'search': 0.08, 'news': 0.3, 'llm': 0.8}
+DEFAULT_MIX = {'predict': 1, 'market': 4, 'search': 4, 'chat': 1}
+SEARCH_QUERIES = ['a', 'ap', 'app', 'ms', 'goo', 'nv', 'tes', 'bit', 'eth', 'spy', 'xyz', 'qq']
+
+
+# --- Stand-ins ---
+class UpstreamError(Exception):
+    pass
+
+
+class Upstream:
+    """Latency and failure injection shared by the stand-ins, with call counters"""
+
+    def __init__(self, name, latency=0.0, failure_rate=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, wait=True):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.failure_rate
+            self.failures += failed
+        if wait and self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise UpstreamError(f"Injected {self.name} failure.")
+
+    def stats(self):
+        return {'calls': self.calls, 'failures': self.failures,
+                'latency_s': self.latency, 'failure_rate': self.failure_rate}
+
+
+def _seed(ticker):
+    return int(hashlib.md5(ticker.encode()).hexdigest()[:8], 16)
+
+
+class StubPriceSource(DataSource):
+    """Synthetic daily bars per ticker, stands in for yfinance history"""
+    name = 'loadtest'
+
+    def __init__(self, upstream, length=1250):
+        self.upstream = upstream
+        self.length = length
+
+    def fetch(self, ticker, start=None, period='5y'):
+        self.upstream.call()
+        df = synthetic_ohlcv(self.length, seed=_seed(ticker))
+        if start is not None:
+            df = df[df.index >= start]
+        return df
+
+
+class StubQuotes:
+    """Replaces the market summary fetch (yfinance fast_info); a failed ticker is skipped"""
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+
+    def __call__(self, tickers):
+        # The real fetch asks for every ticker concurrently, so the latency is paid once
+        time.sleep(self.upstream.latency)
+        quotes = []
+        for ticker in tickers:
+            try:
+                self.upstream.call(wait=False)
+            except UpstreamError:
+                continue
+            price = 100 + _seed(ticker) % 400 + random.uniform(-1, 1)
+            change = random.uniform(-3, 3)
+            quotes.append({'ticker': ticker, 'price': price, 'change': change,
+                           'change_pct': change / (price - change) * 100})
+        return quotes
+
+
+class StubSearchSession:
+    """Answers symbol_search's upstream requests.get like Yahoo's search API"""
+
+    class Response:
+        def __init__(self, data):
+            self.data = data
+
+        def json(self):
+            return self.data
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+
+    def get(self, url, params=None, timeout=None):
+        self.upstream.call()
+        query = (params or {}).get('q', '').upper()
+        quotes = [{'symbol': f"{query}{i}", 'shortname': f"{query} Holdings {i}", 'exchange': 'NMS'} for i in range(5)]
+        return self.Response({'quotes': quotes})
+
+
+class StubNewsBackend(NewsBackend):
+    """Stands in for DuckDuckGo news"""
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+
+    def search(self, query, limit=5):
+        self.upstream.call()
+        return [{'title': f"{query} headline {i}", 'source': 'Wire', 'date': '2024-01-01',
+                 'url': f"https://example.com/{i}", 'body': 'Shares moved on volume.'} for i in range(limit)]
+
+
+class StubLLMProvider(LLMProvider):
+    """Stands in for OpenAI/Gemini: the reply arrives in pieces spread over the latency"""
+    default_model = 'stub'
+    models = ['stub']
+
+    def __init__(self, upstream, pieces=20):
+        self.upstream = upstream
+        self.pieces = pieces
+
+    def stream(self, system_prompt, message, api_key, model=None):
+        self.upstream.call(wait=False)
+        for i in range(self.pieces):
+            time.sleep(self.upstream.latency / self.pieces)
+            yield f"token{i} "
+
+
+def install_stubs(latency, failure_rate, seed=0):
+    """Points every upstream at a stand-in; returns the Upstream counters by name"""
+    from models.market_summary import summary_cache
+    from models.symbol_search import symbol_search
+    upstreams = {name: Upstream(name, latency[name], failure_rate[name], seed + i) for i, name in enumerate(UPSTREAMS)}
+    set_data_source(StubPriceSource(upstreams['prices']))
+    summary_cache.fetch = StubQuotes(upstreams['quotes'])
+    symbol_search.session = StubSearchSession(upstreams['search'])
+    set_news_backend(StubNewsBackend(upstreams['news']))
+    # Registered under the real names so the settings/API key checks run unchanged
+    llm = StubLLMProvider(upstreams['llm'])
+    register_provider('openai', llm)
+    register_provider('gemini', llm)
+    return upstreams
+
+
+# --- Server ---
+def start_server(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# --- Traffic ---
+def make_requests(args):
+    """Request builders by endpoint name, each taking a random.Random"""
+    tickers = [f"LT{i:03d}" for i in range(args.tickers)]
+    return {
+        'predict': lambda rng: ('POST', '/predict', {
+            'ticker': rng.choice(tickers), 'model_type': rng.choice(args.models),
+            'look_back': 60, 'forecast_days': 5}),
+        'market': lambda rng: ('GET', '/market-summary', None),
+        'search': lambda rng: ('GET', f"/search?q={rng.choice(SEARCH_QUERIES)}{rng.randrange(args.search_keys)}", None),
+        'chat': lambda rng: ('POST', '/chat', {
+            'provider': 'openai', 'message': 'Why is it moving? Any news?',
+            'context': {'ticker': rng.choice(tickers), 'current_price': 100, 'recommendation': 'HOLD',
+                        'rsi': 50, 'sma_50': 100, 'signals': []}}),
+        'chat_stream': lambda rng: ('POST', '/chat/stream', {
+            'provider': 'openai', 'message': 'Summarise the latest headlines.',
+            'context': {'ticker': rng.choice(tickers)}}),
+    }
+
+
+def _worker(index, base_url, builders, mix, deadline, seed, samples):
+    rng = random.Random(seed + index)
+    names, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, body = builders[name](rng)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=120)
+            # Read the whole body so streamed responses are timed to their end
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        samples.append((name, time.perf_counter() - start, ok))
+
+
+def run_load(base_url, builders, mix, concurrency, duration, seed):
+    samples = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=_worker, args=(i, base_url, builders, mix, deadline, seed, samples))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    """Throughput and latency percentiles per endpoint and overall"""
+    def stats(rows):
+        latencies = np.array([r[1] for r in rows]) if rows else np.zeros(1)
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if not r[2]),
+            'rps': round(len(rows) / elapsed, 2),
+            'mean_ms': round(float(latencies.mean()) * 1e3, 2),
+            'p50_ms': round(float(np.percentile(latencies, 50)) * 1e3, 2),
+            'p90_ms': round(float(np.percentile(latencies, 90)) * 1e3, 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)) * 1e3, 2),
+            'max_ms': round(float(latencies.max()) * 1e3, 2),
+        }
+    endpoints = {name: stats([s for s in samples if s[0] == name]) for name in sorted({s[0] for s in samples})}
+    endpoints['all'] = stats(samples)
+    return endpoints
+
+
+# --- Reporting ---
+def print_report(endpoints, upstreams):
+    print(f"\n{'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in endpoints.items():
+        print(f"{name:<12} {s['requests']:>9} {s['errors']:>7} {s['rps']:>9.2f} {s['p50_ms']:>9.1f} "
+              f"{s['p90_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+    print(f"\n{'upstream':<12} {'calls':>9} {'failures':>9}")
+    for name, s in upstreams.items():
+        print(f"{name:<12} {s['calls']:>9} {s['failures']:>9}")
+
+
+def compare(endpoints, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)['endpoints']
+    print(f"\nComparison against {baseline_path} (req/s ratio < 1 or latency ratio > 1 means worse now)")
+    for name, s in endpoints.items():
+        old = baseline.get(name)
+        if not old or not old['rps'] or not old['p50_ms'] or not old['p99_ms']:
+            continue
+        ratios = {'rps': s['rps'] / old['rps'], 'p50': s['p50_ms'] / old['p50_ms'], 'p99': s['p99_ms'] / old['p99_ms']}
+        s['baseline_ratio'] = {k: round(v, 3) for k, v in ratios.items()}
+        flag = '  <-- regression' if ratios['rps'] < 0.8 or ratios['p99'] > 1.2 else ''
+        print(f"{name:<12} req/s {ratios['rps']:>6.2f}x  p50 {ratios['p50']:>6.2f}x  p99 {ratios['p99']:>6.2f}x{flag}")
+
+
+def per_upstream(value, defaults):
+    """'0.1' sets every upstream, 'llm=0.5,news=0.2' (optionally after a plain value) sets some"""
+    result = dict(defaults)
+    for part in filter(None, value.split(',')):
+        if '=' in part:
+            name, number = part.split('=', 1)
+            if name not in UPSTREAMS:
+                raise argparse.ArgumentTypeError(f"Unknown upstream '{name}'.")
+            result[name] = float(number)
+        else:
+            result = {name: float(part) for name in UPSTREAMS}
+    return result
+
+
+def weights(value):
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=', 1)
+        mix[name] = float(weight)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of traffic')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--mix', type=weights, default=DEFAULT_MIX,
+                        help='endpoint weights: predict, market, search, chat, chat_stream')
+    parser.add_argument('--latency', type=lambda v: per_upstream(v, DEFAULT_LATENCY), default=DEFAULT_LATENCY,
+                        help=f"stand-in latency in seconds ({', '.join(UPSTREAMS)})")
+    parser.add_argument('--failure-rate', type=lambda v: per_upstream(v, dict.fromkeys(UPSTREAMS, 0.0)),
+                        default=dict.fromkeys(UPSTREAMS, 0.0), help='fraction of stand-in calls that fail')
+    parser.add_argument('--models', type=lambda v: v.split(','), default=['linear'], help='model types for /predict')
+    parser.add_argument('--tickers', type=int, default=10, help='distinct tickers for /predict and /chat')
+    parser.add_argument('--search-keys', type=int, default=50, help='distinct suffixes per search query')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_results.json')
+    parser.add_argument('--baseline', help='previous report to compare against')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own output")
+    args = parser.parse_args(argv)
+    builders = make_requests(args)
+    unknown = set(args.mix) - set(builders)
+    if unknown:
+        parser.error(f"unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return args, builders
+
+
+def main(argv=None):
+    args, builders = parse_args(argv)
+    commit = git_commit()
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Relative data paths (store, registry, symbols, api_settings.json) resolve in a scratch directory
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with open('api_settings.json', 'w') as f:
+            json.dump({'openai_api_key': 'loadtest', 'gemini_api_key': 'loadtest'}, f)
+        upstreams = install_stubs(args.latency, args.failure_rate, args.seed)
+        import app as server
+        server.start_warmup()
+        httpd, base_url = start_server(server.app)
+
+        quiet = open(os.devnull, 'w') if not args.verbose else None
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            print(f"Driving {base_url} for {args.duration:.0f}s with {args.concurrency} clients", file=sys.stderr)
+            samples, elapsed = run_load(base_url, builders, args.mix, args.concurrency, args.duration, args.seed)
+        httpd.shutdown()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    endpoints = summarize(samples, elapsed)
+    upstream_stats = {name: u.stats() for name, u in upstreams.items()}
+    print_report(endpoints, upstream_stats)
+    if baseline:
+        compare(endpoints, baseline)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'max_rss_mb': max_rss_mb(),
+        },
+        'config': {
+            'duration_s': args.duration,
+            'elapsed_s': round(elapsed, 3),
+            'concurrency': args.concurrency,
+            'mix': args.mix,
+            'models': args.models,
+            'tickers': args.tickers,
+            'seed': args.seed,
+        },
+        'endpoints': endpoints,
+        'upstreams': upstream_stats,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote report to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,153 @@
 import os
-import openai
-import google.generativeai as genai
+import sys
+import time
+import threading
 from dotenv import load_dotenv
 from chat.news_service import get_stock_news, format_news_for_llm
+from metrics import chat_seconds, chat_first_token_seconds
 
 load_dotenv()
 
-def get_chat_response(provider, message, context=None, api_key=None, model=None):
+# Point the OpenAI client at any compatible server (e.g. a local fake for tests)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Valid model names for validation
+openai_models = ['gpt-5.1', 'gpt-5-mini', 'gpt-4o', 'gpt-3.5-turbo']
+gemini_models = ['gemini-3-pro-preview', 'gemini-2.5-pro', 'gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-pro']
+
+
+# --- Providers ---
+class LLMProvider:
     """
-    Generates a response from the selected LLM provider.
-    Context contains stock data to inject into the system prompt.
-    api_key: User-provided API key (takes precedence over env vars)
-    model: Specific model name to use (e.g., 'gpt-5.1', 'gemini-2.5-pro')
+    A chat backend. complete() returns the full reply, stream() yields it in
+    pieces as they are generated. Both take the already built system prompt.
     """
-    
+    default_model = None
+    models = []
+    env_key = None
+
+    def resolve_key(self, api_key):
+        return api_key or (os.getenv(self.env_key) if self.env_key else None)
+
+    def resolve_model(self, model):
+        return model if model and model in self.models else self.default_model
+
+    def complete(self, system_prompt, message, api_key, model=None):
+        return ''.join(self.stream(system_prompt, message, api_key, model))
+
+    def stream(self, system_prompt, message, api_key, model=None):
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    default_model = 'gpt-3.5-turbo'
+    models = openai_models
+    env_key = 'OPENAI_API_KEY'
+
+    def __init__(self, base_url=OPENAI_BASE_URL):
+        self.base_url = base_url
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, api_key):
+        import openai
+        # One client per key, so its HTTP connection pool is reused across messages
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = openai.OpenAI(api_key=api_key, base_url=self.base_url)
+                self._clients[api_key] = client
+            return client
+
+    def _messages(self, system_prompt, message):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message}
+        ]
+
+    def complete(self, system_prompt, message, api_key, model=None):
+        response = self.client(api_key).chat.completions.create(
+            model=self.resolve_model(model),
+            messages=self._messages(system_prompt, message)
+        )
+        return response.choices[0].message.content
+
+    def stream(self, system_prompt, message, api_key, model=None):
+        response = self.client(api_key).chat.completions.create(
+            model=self.resolve_model(model),
+            messages=self._messages(system_prompt, message),
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class GeminiProvider(LLMProvider):
+    default_model = 'gemini-2.5-flash'
+    models = gemini_models
+    env_key = 'GEMINI_API_KEY'
+
+    def __init__(self):
+        self._configured_key = None
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, api_key, model):
+        import google.generativeai as genai
+        # genai.configure is process wide, so only redo it (and drop cached models) when the key changes
+        with self._lock:
+            if api_key != self._configured_key:
+                genai.configure(api_key=api_key)
+                self._configured_key = api_key
+                self._models.clear()
+            name = self.resolve_model(model)
+            gen_model = self._models.get(name)
+            if gen_model is None:
+                gen_model = genai.GenerativeModel(name)
+                self._models[name] = gen_model
+            return gen_model
+
+    def _prompt(self, system_prompt, message):
+        # Gemini doesn't have a strict 'system' role in the same way, but we can prepend it
+        return f"{system_prompt}\n\nUser: {message}"
+
+    def complete(self, system_prompt, message, api_key, model=None):
+        response = self.model(api_key, model).generate_content(self._prompt(system_prompt, message))
+        return response.text
+
+    def stream(self, system_prompt, message, api_key, model=None):
+        response = self.model(api_key, model).generate_content(self._prompt(system_prompt, message), stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Safety or finish-only chunks carry no text parts
+                continue
+            if text:
+                yield text
+
+
+providers = {
+    'openai': OpenAIProvider(),
+    'gemini': GeminiProvider(),
+}
+
+
+def register_provider(name, provider):
+    """Adds or replaces a provider, e.g. a fake one in tests"""
+    providers[name] = provider
+
+
+# --- Prompt ---
+def build_system_prompt(message, context=None):
     # Check if user is asking for news/real-time info
     news_keywords = ['news', 'latest', 'headline', 'happening', 'update', 'recent', 'why', 'moving', 'event']
     include_news = any(keyword in message.lower() for keyword in news_keywords)
-    
+
     # Construct System Prompt
     system_prompt = "You are a helpful financial assistant and stock market analyst."
-    
+
     if context:
         ticker = context.get('ticker')
         system_prompt += f"\n\nCurrent Stock Context for {ticker}:"
@@ -29,7 +156,7 @@ def get_chat_response(provider, message, context=None, api_key=None, model=None)
         system_prompt += f"\n- RSI: {context.get('rsi')}"
         system_prompt += f"\n- SMA(50): {context.get('sma_50')}"
         system_prompt += f"\n- Key Signals: {', '.join(context.get('signals', []))}"
-        
+
         # Fetch and inject news if requested or relevant
         if include_news:
             try:
@@ -41,61 +168,76 @@ def get_chat_response(provider, message, context=None, api_key=None, model=None)
                 print(f"News fetch failed: {e}")
 
         system_prompt += "\nUse this data to answer the user's questions accurately. Do not give financial advice, but explain the technical indicators."
+    return system_prompt
 
-    # Valid model names for validation
-    openai_models = ['gpt-5.1', 'gpt-5-mini', 'gpt-4o', 'gpt-3.5-turbo']
-    gemini_models = ['gemini-3-pro-preview', 'gemini-2.5-pro', 'gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-pro']
 
-    try:
-        if provider == 'openai':
-            # Use provided API key or fall back to environment variable
-            if not api_key:
-                api_key = os.getenv('OPENAI_API_KEY')
-            if not api_key:
-                return "Error: OpenAI API key not configured. Please add your API key in settings."
-            
-            # Determine which model to use (default to gpt-3.5-turbo if not specified or invalid)
-            selected_model = model if model and model in openai_models else 'gpt-3.5-turbo'
-            
-            client = openai.OpenAI(api_key=api_key)
-            response = client.chat.completions.create(
-                model=selected_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ]
-            )
-            return response.choices[0].message.content
-
-        elif provider == 'gemini':
-            # Use provided API key or fall back to environment variable
-            if not api_key:
-                api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                return "Error: Gemini API key not configured. Please add your API key in settings."
-            
-            genai.configure(api_key=api_key)
-            
-            # Determine which model to use (default to gemini-2.5-flash if not specified or invalid)
-            selected_model = model if model and model in gemini_models else 'gemini-2.5-flash'
-            
-            # Use GenerativeModel with the selected model
-            gen_model = genai.GenerativeModel(selected_model)
-            
-            # Gemini doesn't have a strict 'system' role in the same way, but we can prepend it
-            full_prompt = f"{system_prompt}\n\nUser: {message}"
-            response = gen_model.generate_content(full_prompt)
-            return response.text
-
-        else:
-            return "Error: Invalid provider selected."
-
-    except openai.AuthenticationError:
+def _error_message(provider, e):
+    # The SDKs are imported lazily, so only check for OpenAI errors once it is loaded
+    openai = sys.modules.get('openai')
+    if openai is not None and isinstance(e, openai.AuthenticationError):
         return "Error: Invalid OpenAI API key. Please check your settings."
+    error_msg = str(e)
+    if "API key" in error_msg or "authentication" in error_msg.lower():
+        return f"Error: Authentication failed. Please check your {provider.upper()} API key in settings."
+    if "model" in error_msg.lower() and ("not found" in error_msg.lower() or "invalid" in error_msg.lower()):
+        return f"Error: The selected model may not be available or you may not have access to it. Please try a different model."
+    return f"Error communicating with AI: {error_msg}"
+
+
+def _resolve(provider, api_key):
+    """Returns (provider_impl, api_key, error)"""
+    impl = providers.get(provider)
+    if impl is None:
+        return None, None, "Error: Invalid provider selected."
+    # Use provided API key or fall back to environment variable
+    api_key = impl.resolve_key(api_key)
+    if not api_key:
+        name = 'OpenAI' if provider == 'openai' else provider.capitalize()
+        return None, None, f"Error: {name} API key not configured. Please add your API key in settings."
+    return impl, api_key, None
+
+
+def get_chat_response(provider, message, context=None, api_key=None, model=None):
+    """
+    Generates a response from the selected LLM provider.
+    Context contains stock data to inject into the system prompt.
+    api_key: User-provided API key (takes precedence over env vars)
+    model: Specific model name to use (e.g., 'gpt-5.1', 'gemini-2.5-pro')
+    """
+    impl, api_key, error = _resolve(provider, api_key)
+    if error:
+        return error
+    start = time.perf_counter()
+    try:
+        reply = impl.complete(build_system_prompt(message, context), message, api_key, model)
+        chat_seconds.observe(time.perf_counter() - start, provider=provider, mode='complete', status='ok')
+        return reply
+    except Exception as e:
+        chat_seconds.observe(time.perf_counter() - start, provider=provider, mode='complete', status='error')
+        return _error_message(provider, e)
+
+
+def stream_chat_response(provider, message, context=None, api_key=None, model=None):
+    """
+    Same as get_chat_response but yields {'delta': text} events as the provider
+    generates the reply. Failures end the stream with an {'error': text} event.
+    """
+    impl, api_key, error = _resolve(provider, api_key)
+    if error:
+        yield {'error': error}
+        return
+    start = time.perf_counter()
+    first = True
+    status = 'ok'
+    try:
+        for piece in impl.stream(build_system_prompt(message, context), message, api_key, model):
+            if first:
+                chat_first_token_seconds.observe(time.perf_counter() - start, provider=provider)
+                first = False
+            yield {'delta': piece}
     except Exception as e:
-        error_msg = str(e)
-        if "API key" in error_msg or "authentication" in error_msg.lower():
-            return f"Error: Authentication failed. Please check your {provider.upper()} API key in settings."
-        if "model" in error_msg.lower() and ("not found" in error_msg.lower() or "invalid" in error_msg.lower()):
-            return f"Error: The selected model may not be available or you may not have access to it. Please try a different model."
-        return f"Error communicating with AI: {error_msg}"
+        status = 'error'
+        yield {'error': _error_message(provider, e)}
+    finally:
+        # Also reached when the client disconnects and the generator is closed early
+        chat_seconds.observe(time.perf_counter() - start, provider=provider, mode='stream', status=status)
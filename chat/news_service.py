@@ -1,32 +1,150 @@
-from duckduckgo_search import DDGS
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from metrics import news_fetch_seconds
 
-def get_stock_news(ticker, limit=5):
+NEWS_CACHE_TTL = int(os.getenv('NEWS_CACHE_TTL', '900'))
+NEWS_CACHE_SIZE = int(os.getenv('NEWS_CACHE_SIZE', '256'))
+
+
+# --- Search Backends ---
+class NewsBackend:
+    """Anything with search(query, limit) returning DDGS-style dicts (title, source, date, url, body)"""
+
+    def search(self, query, limit=5):
+        raise NotImplementedError
+
+
+class DuckDuckGoBackend(NewsBackend):
+    def search(self, query, limit=5):
+        from duckduckgo_search import DDGS
+        # Use the context manager for DDGS
+        with DDGS() as ddgs:
+            return list(ddgs.news(keywords=query, max_results=limit))
+
+
+class StaticNewsBackend(NewsBackend):
+    """Serves fixed items, for tests and offline runs"""
+
+    def __init__(self, items=None, delay=0.0):
+        self.items = items or []
+        self.delay = delay
+        self.calls = 0
+
+    def search(self, query, limit=5):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.items[:limit]
+
+
+# --- Cache ---
+class NewsCache:
     """
-    Fetches the latest news for a given stock ticker using DuckDuckGo.
+    Per-ticker news with a TTL and LRU size bound.
+    Concurrent requests for the same ticker share one backend search.
     """
-    try:
+
+    def __init__(self, backend=None, ttl=NEWS_CACHE_TTL, max_size=NEWS_CACHE_SIZE):
+        self.backend = backend or DuckDuckGoBackend()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='news-prefetch')
+
+    def get(self, ticker, limit=5):
+        key = (ticker.upper(), limit)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and time.time() - cached[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            results = self._fetch(ticker, limit)
+            with self._lock:
+                # Failures are not cached, the next call tries again
+                if results is not None:
+                    self._entries[key] = (time.time(), results)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+            future.set_result(results or [])
+        except Exception as e:
+            future.set_result([])
+            print(f"Error fetching news for {ticker}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return future.result()
+
+    def prefetch(self, ticker, limit=5):
+        """Warms the cache in the background so a later chat message does not wait on search"""
+        key = (ticker.upper(), limit)
+        with self._lock:
+            cached = self._entries.get(key)
+            if (cached and time.time() - cached[0] < self.ttl) or key in self._in_flight:
+                return
+        self._prefetcher.submit(self.get, ticker, limit)
+
+    def _fetch(self, ticker, limit):
         # Query specifically for stock news
         query = f"{ticker} stock news latest financial"
-        
+        start = time.perf_counter()
+        try:
+            raw = self.backend.search(query, limit)
+        except Exception as e:
+            news_fetch_seconds.observe(time.perf_counter() - start, status='error')
+            print(f"Error fetching news for {ticker}: {e}")
+            return None
+        news_fetch_seconds.observe(time.perf_counter() - start, status='ok')
         results = []
-        # Use the context manager for DDGS
-        with DDGS() as ddgs:
-            # Fetch news results
-            news_gen = ddgs.news(keywords=query, max_results=limit)
-            
-            for r in news_gen:
-                results.append({
-                    'title': r.get('title', 'No title'),
-                    'source': r.get('source', 'Unknown Source'),
-                    'date': r.get('date', ''),
-                    'url': r.get('url', '#'),
-                    'body': r.get('body', '')
-                })
-                
+        for r in raw:
+            results.append({
+                'title': r.get('title', 'No title'),
+                'source': r.get('source', 'Unknown Source'),
+                'date': r.get('date', ''),
+                'url': r.get('url', '#'),
+                'body': r.get('body', '')
+            })
         return results
-    except Exception as e:
-        print(f"Error fetching news for {ticker}: {e}")
-        return []
+
+
+news_cache = NewsCache()
+
+
+def set_news_backend(backend):
+    """Swaps the search backend (e.g. a StaticNewsBackend in tests) and drops cached news"""
+    global news_cache
+    news_cache = NewsCache(backend)
+
+
+def get_stock_news(ticker, limit=5):
+    """
+    Fetches the latest news for a given stock ticker using DuckDuckGo.
+    Results are cached per ticker for NEWS_CACHE_TTL seconds.
+    """
+    return news_cache.get(ticker, limit)
+
+
+def prefetch_stock_news(ticker, limit=5):
+    news_cache.prefetch(ticker, limit)
+
 
 def format_news_for_llm(news_items):
     """
@@ -34,7 +152,7 @@ def format_news_for_llm(news_items):
     """
     if not news_items:
         return "No recent news found."
-        
+
     formatted = "\nRecent News & Headlines:\n"
     for i, item in enumerate(news_items, 1):
         formatted += f"{i}. {item['title']} (Source: {item['source']})\n"
@@ -42,6 +160,5 @@ def format_news_for_llm(news_items):
         if item['body']:
             snippet = item['body'][:150] + "..." if len(item['body']) > 150 else item['body']
             formatted += f"   Summary: {snippet}\n"
-            
-    return formatted
 
+    return formatted
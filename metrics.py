@@ -0,0 +1,241 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Histograms and counters are labelled and thread-safe. StageTimer times the
+stages of one pipeline run; code further down the call stack reports into
+the active timer through stage() without it being passed around.
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(l, '') for l in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(l, '') for l in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, {'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, {'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, name, help_text, func, metric_type='gauge'):
+        """
+        Registers a value read at scrape time. func returns a number, or a dict
+        mapping tuples of (label, value) pairs to numbers.
+        """
+        with self._lock:
+            self._collectors.append((name, help_text, func, metric_type))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines += metric.render()
+        for name, help_text, func, metric_type in collectors:
+            try:
+                value = func()
+            except Exception as e:
+                print(f"Error collecting metric {name}: {e}")
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    names, values = zip(*labels) if labels else ((), ())
+                    lines.append(f"{name}{_format_labels(names, values)} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+predict_stage_seconds = registry.histogram(
+    'predict_stage_seconds', 'Time spent in each train_and_predict stage', ('stage', 'model'))
+predict_seconds = registry.histogram(
+    'predict_seconds', 'Total train_and_predict time', ('model', 'status'))
+http_request_seconds = registry.histogram(
+    'http_request_seconds', 'HTTP request duration by endpoint', ('endpoint', 'method', 'status'))
+chat_seconds = registry.histogram(
+    'chat_seconds', 'LLM response time', ('provider', 'mode', 'status'))
+chat_first_token_seconds = registry.histogram(
+    'chat_first_token_seconds', 'Time until the first streamed LLM token', ('provider',))
+news_fetch_seconds = registry.histogram(
+    'news_fetch_seconds', 'News search backend call duration', ('status',))
+
+
+# --- Per-run stage timing ---
+def current_rss_mb():
+    """Resident set size of this process in MB (None where it cannot be read cheaply)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+    except ImportError:
+        return None
+
+
+_current_timer = contextvars.ContextVar('stage_timer', default=None)
+
+
+class StageTimer:
+    """
+    Collects {stage: seconds} for one run and feeds predict_stage_seconds.
+    While active (inside `with`), stage() anywhere in the same thread reports into it.
+    """
+
+    def __init__(self, model='', sample_memory=False):
+        self.model = model
+        self.sample_memory = sample_memory
+        self.stages = {}
+        self.memory = {}
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_timer.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_timer.reset(self._token)
+
+    @contextmanager
+    def stage(self, name):
+        rss_before = current_rss_mb() if self.sample_memory else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            predict_stage_seconds.observe(elapsed, stage=name, model=self.model)
+            if rss_before is not None:
+                rss_after = current_rss_mb()
+                if rss_after is not None:
+                    self.memory[name] = {'rss_mb': round(rss_after, 1), 'rss_delta_mb': round(rss_after - rss_before, 1)}
+
+    def to_dict(self):
+        data = {name: round(seconds, 6) for name, seconds in self.stages.items()}
+        data['total'] = round(sum(self.stages.values()), 6)
+        if self.memory:
+            data['memory'] = self.memory
+        return data
+
+
+@contextmanager
+def stage(name):
+    """Times a stage into the active StageTimer, or does nothing when there is none"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def profile_call(func, *args, limit=30, **kwargs):
+    """Runs func under cProfile, returns (result, text of the top `limit` functions by cumulative time)"""
+    import io
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+    return result, out.getvalue()
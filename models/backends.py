@@ -0,0 +1,93 @@
+import os
+import threading
+from types import SimpleNamespace
+
+# Model types to import at startup, comma separated ('all' for every backend, empty for none)
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '')
+
+
+def _load_keras():
+    import tensorflow as tf
+    from models.runtime import configure_tf_threads
+    configure_tf_threads(tf)
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, GRU, Dense
+    return SimpleNamespace(tf=tf, Sequential=Sequential, LSTM=LSTM, GRU=GRU, Dense=Dense)
+
+
+def _load_linear():
+    from sklearn.linear_model import LinearRegression
+    return SimpleNamespace(LinearRegression=LinearRegression)
+
+
+def _load_random_forest():
+    from sklearn.ensemble import RandomForestRegressor
+    return SimpleNamespace(RandomForestRegressor=RandomForestRegressor)
+
+
+def _load_xgboost():
+    import xgboost as xgb
+    from sklearn.multioutput import MultiOutputRegressor
+    return SimpleNamespace(xgb=xgb, MultiOutputRegressor=MultiOutputRegressor)
+
+
+class Backend:
+    """A model family whose libraries are imported the first time it is used"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def get(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = self.loader()
+        return self._module
+
+
+_keras = Backend('keras', _load_keras)
+
+BACKENDS = {
+    'lstm': _keras,
+    'gru': _keras,
+    'linear': Backend('linear', _load_linear),
+    'random_forest': Backend('random_forest', _load_random_forest),
+    'xgboost': Backend('xgboost', _load_xgboost),
+}
+MODEL_TYPES = tuple(BACKENDS)
+
+
+def get_backend(model_type):
+    """Returns the (lazily imported) libraries for a model type"""
+    backend = BACKENDS.get(model_type)
+    if backend is None:
+        raise ValueError(f"Unknown model type '{model_type}'.")
+    return backend.get()
+
+
+def loaded_backends():
+    return sorted({b.name for b in BACKENDS.values() if b.loaded})
+
+
+def warm_up(model_types=None):
+    """
+    Imports backends ahead of the first request.
+    model_types defaults to MODEL_WARMUP; 'all' loads every backend.
+    """
+    if model_types is None:
+        model_types = [t.strip() for t in MODEL_WARMUP.split(',') if t.strip()]
+    if 'all' in model_types:
+        model_types = MODEL_TYPES
+    for model_type in model_types:
+        try:
+            get_backend(model_type)
+        except Exception as e:
+            print(f"Error warming up {model_type} backend: {e}")
+    return loaded_backends()
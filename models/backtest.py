@@ -0,0 +1,255 @@
+"""
+Walk-forward backtesting.
+
+The series is windowed once; every fold trains on a slice of those windows
+and predicts the next block of bars one step ahead, so the score reflects how
+the model would have done had it been retrained on each date. ML folds run
+concurrently on a thread pool (the window arrays are shared, not copied);
+deep models run their folds in order and warm-start from the previous fold.
+
+    python -m models.backtest AAPL MSFT --model random_forest --folds 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from models.windows import build_windows, as_sequence
+from models.model_registry import DL_MODELS
+from models.runtime import cpu_count, thread_budget
+from models.backends import MODEL_TYPES
+
+BACKTEST_FOLDS = int(os.getenv('BACKTEST_FOLDS', '5'))
+# Threads for concurrent ML folds, 0 = one per CPU
+BACKTEST_WORKERS = int(os.getenv('BACKTEST_WORKERS', '0'))
+# Most epochs for each warm-started deep-learning fold; the first fold trains like /predict does
+BACKTEST_WARM_EPOCHS = int(os.getenv('BACKTEST_WARM_EPOCHS', '2'))
+SCHEMES = ('expanding', 'rolling')
+
+
+def make_folds(n_windows, n_folds=BACKTEST_FOLDS, test_size=None, scheme='expanding', train_size=None):
+    """
+    Splits n_windows samples into consecutive (train_start, train_end, test_start, test_end)
+    index ranges. The test blocks tile the end of the series; 'expanding' trains on
+    everything before each block, 'rolling' on a fixed-size window just before it.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown scheme '{scheme}'.")
+    test_size = test_size or n_windows // (n_folds + 1)
+    first_test = n_windows - n_folds * test_size
+    train_size = train_size or first_test
+    if test_size < 1 or first_test < 1 or train_size > first_test:
+        raise ValueError(f"Not enough data for {n_folds} folds of {test_size} bars.")
+
+    folds = []
+    for k in range(n_folds):
+        test_start = first_test + k * test_size
+        train_start = 0 if scheme == 'expanding' else test_start - train_size
+        folds.append((train_start, test_start, test_start, test_start + test_size))
+    return folds
+
+
+def _errors(actual, predicted, previous):
+    """Error metrics for one block of one-step-ahead predictions"""
+    actual, predicted, previous = (np.asarray(a, dtype=np.float64).reshape(-1) for a in (actual, predicted, previous))
+    error = predicted - actual
+    # Did the model call the direction of the next move correctly?
+    direction = np.sign(predicted - previous) == np.sign(actual - previous)
+    return {
+        'rmse': float(np.sqrt(np.mean(error ** 2))),
+        'mae': float(np.mean(np.abs(error))),
+        'mape': float(np.mean(np.abs(error / actual)) * 100),
+        'direction_accuracy': float(np.mean(direction)),
+    }
+
+
+def _fold_result(fold, index, dates, look_back, actual, predicted, previous, fit_seconds):
+    train_start, train_end, test_start, test_end = fold
+    result = {
+        'fold': index,
+        'train_start': dates[train_start + look_back],
+        'train_end': dates[train_end + look_back - 1],
+        'test_start': dates[test_start + look_back],
+        'test_end': dates[test_end + look_back - 1],
+        'n_train': train_end - train_start,
+        'n_test': test_end - test_start,
+        'fit_seconds': round(fit_seconds, 4),
+    }
+    result.update(_errors(actual, predicted, previous))
+    return result
+
+
+def _run_ml_fold(model_type, X, y, fold, n_jobs):
+    from models.prediction_engine import build_ml_model
+    train_start, train_end, test_start, test_end = fold
+    model = build_ml_model(model_type, n_jobs=n_jobs)
+    start = time.perf_counter()
+    # Slices of the shared window view, the estimator makes the only copy it needs
+    model.fit(X[train_start:train_end], y[train_start:train_end])
+    fit_seconds = time.perf_counter() - start
+    predicted = model.predict(X[test_start:test_end])
+    return predicted, fit_seconds
+
+
+def _run_dl_folds(model_type, X, y, folds, look_back):
+    """
+    Folds run in order and each one continues training the previous fold's network,
+    so only the first pays for a full fit. Scaling is refit on each fold's training
+    range (no look-ahead) and applied to the shared raw windows as they are sliced;
+    the carried network is rescaled to each new range before it trains on it.
+    Training goes through fit_dl_model with the params /predict serves.
+    """
+    from models.prediction_engine import build_dl_model, fit_dl_model, rescale_dl_model, model_params
+    params = model_params(model_type)
+    model, fold_range = None, None
+    outputs = []
+    for train_start, train_end, test_start, test_end in folds:
+        seen = np.concatenate([X[train_start], y[train_start:train_end]])
+        low = float(seen.min())
+        scale = (float(seen.max()) - low) or 1.0
+
+        if model is None:
+            model = build_dl_model(model_type, look_back, units=params['units'])
+            fold_params = params
+        else:
+            rescale_dl_model(model, fold_range, (low, low + scale))
+            fold_params = dict(params, epochs=BACKTEST_WARM_EPOCHS)
+        fold_range = (low, low + scale)
+        training = fit_dl_model(model, as_sequence((X[train_start:train_end] - low) / scale),
+                                (y[train_start:train_end] - low) / scale, model_type, fold_params)
+        scaled = model.predict(as_sequence((X[test_start:test_end] - low) / scale), batch_size=256, verbose=0)
+        outputs.append((scaled.reshape(-1) * scale + low, training['fit_seconds']))
+    return outputs
+
+
+def walk_forward(df, look_back=60, model_type='linear', n_folds=BACKTEST_FOLDS, test_size=None,
+                 scheme='expanding', train_size=None, workers=None):
+    """
+    Walk-forward evaluation of one model type on an OHLCV frame.
+    Returns per-fold metrics plus an aggregate over all folds.
+    """
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Unknown model type '{model_type}'.")
+    start = time.perf_counter()
+    close = df['Close'].values
+    dates = df.index.strftime('%Y-%m-%d').tolist()
+    # One set of windows for every fold; folds only ever take slices of it
+    X, y = build_windows(close, look_back)
+    folds = make_folds(len(X), n_folds, test_size, scheme, train_size)
+
+    if model_type in DL_MODELS:
+        outputs = _run_dl_folds(model_type, X, y, folds, look_back)
+    else:
+        # Inside a batch worker the budget is that worker's share of the machine
+        cores = thread_budget() or cpu_count()
+        workers = max(1, min(workers or BACKTEST_WORKERS or cores, len(folds)))
+        # Split the cores between concurrent folds instead of letting each one grab them all
+        n_jobs = max(1, cores // workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backtest') as pool:
+            outputs = list(pool.map(lambda fold: _run_ml_fold(model_type, X, y, fold, n_jobs), folds))
+
+    results = []
+    all_actual, all_predicted, all_previous = [], [], []
+    for index, (fold, (predicted, fit_seconds)) in enumerate(zip(folds, outputs)):
+        test_start, test_end = fold[2], fold[3]
+        actual = y[test_start:test_end]
+        # Last input bar of each test window, the price the prediction moves away from
+        previous = X[test_start:test_end, -1]
+        results.append(_fold_result(fold, index, dates, look_back, actual, predicted, previous, fit_seconds))
+        all_actual.append(actual)
+        all_predicted.append(np.asarray(predicted).reshape(-1))
+        all_previous.append(previous)
+
+    aggregate = _errors(np.concatenate(all_actual), np.concatenate(all_predicted), np.concatenate(all_previous))
+    for metric in ('rmse', 'mae', 'mape', 'direction_accuracy'):
+        values = [r[metric] for r in results]
+        aggregate[f'{metric}_mean'] = float(np.mean(values))
+        aggregate[f'{metric}_std'] = float(np.std(values))
+
+    return {
+        'model': model_type,
+        'look_back': look_back,
+        'scheme': scheme,
+        'folds': results,
+        'aggregate': aggregate,
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def backtest(ticker, look_back=60, model_type='linear', **kwargs):
+    """walk_forward on a ticker's stored price history"""
+    from models.prediction_engine import get_stock_data
+    df = get_stock_data(ticker)
+    if df is None:
+        return {'ticker': ticker.upper(), 'model': model_type, 'error': 'Could not fetch data.'}
+    try:
+        result = walk_forward(df, look_back, model_type, **kwargs)
+    except ValueError as e:
+        return {'ticker': ticker.upper(), 'model': model_type, 'error': str(e)}
+    result['ticker'] = ticker.upper()
+    return result
+
+
+def run_backtest(ticker, look_back=60, model_type='linear', scheme='expanding', n_folds=None,
+                 test_size=None, train_size=None, progress=None):
+    """backtest with positional options, for the job queue (progress is its stage callback)"""
+    if progress:
+        progress('backtesting')
+    options = {'n_folds': n_folds, 'test_size': test_size, 'train_size': train_size}
+    return backtest(ticker, look_back, model_type, scheme=scheme,
+                    **{key: value for key, value in options.items() if value})
+
+
+def _backtest_one(ticker, look_back, model_type, kwargs):
+    try:
+        return backtest(ticker, look_back, model_type, **kwargs)
+    except Exception as e:
+        return {'ticker': ticker.upper(), 'model': model_type, 'error': str(e)}
+
+
+def backtest_universe(tickers, look_back=60, model_type='linear', workers=None, **kwargs):
+    """
+    Backtests many tickers on the batch process pool and yields each result as it
+    finishes. Each worker runs its folds one at a time, the pool supplies the parallelism.
+    """
+    from concurrent.futures import as_completed
+    from models.batch import get_pool
+    pool = get_pool(workers)
+    kwargs.setdefault('workers', 1)
+    futures = {pool.submit(_backtest_one, t.strip().upper(), look_back, model_type, kwargs): t for t in tickers if t.strip()}
+    try:
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'ticker': futures[future], 'model': model_type, 'error': str(e)}
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tickers', nargs='+')
+    parser.add_argument('--model', default='linear', choices=MODEL_TYPES)
+    parser.add_argument('--look-back', type=int, default=60)
+    parser.add_argument('--folds', type=int, default=BACKTEST_FOLDS)
+    parser.add_argument('--test-size', type=int)
+    parser.add_argument('--scheme', default='expanding', choices=SCHEMES)
+    parser.add_argument('--train-size', type=int, help='training windows per fold for the rolling scheme')
+    parser.add_argument('--workers', type=int, help='processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    # One JSON line per ticker, in completion order
+    for result in backtest_universe(args.tickers, args.look_back, args.model, workers=args.workers,
+                                    n_folds=args.folds, test_size=args.test_size, scheme=args.scheme,
+                                    train_size=args.train_size):
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
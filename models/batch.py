@@ -0,0 +1,87 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from models.runtime import cpu_count, configure_threads, thread_budget
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '0'))  # 0 = one worker per CPU of the thread budget
+BATCH_MAX_TICKERS = int(os.getenv('BATCH_MAX_TICKERS', '500'))
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def worker_layout(workers=None):
+    """
+    Returns (workers, threads_per_worker) so workers * threads never exceeds the CPUs
+    this process may use: its thread budget when one is set (a serve.py worker's share), else all of them.
+    """
+    cpus = thread_budget() or cpu_count()
+    workers = workers or BATCH_WORKERS or cpus
+    workers = max(1, min(workers, cpus))
+    return workers, max(1, cpus // workers)
+
+
+def _init_worker(threads):
+    # Runs in each fresh worker before TensorFlow/XGBoost are imported
+    configure_threads(threads)
+
+
+def _predict_one(ticker, look_back, forecast_days, model_type, forecast_mode):
+    from models.prediction_engine import train_and_predict
+    try:
+        result = train_and_predict(ticker, look_back, forecast_days, model_type, forecast_mode)
+    except Exception as e:
+        result = {'error': str(e)}
+    if 'error' in result:
+        result = {'ticker': ticker.upper(), 'model': model_type, 'error': result['error']}
+    return result
+
+
+def get_pool(workers=None):
+    """
+    Shared process pool. workers only sizes it when it is first created (e.g. by a
+    command line run); batches, sweeps and backtests share the pool afterwards, so
+    it is never torn down while their work is queued on it.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            workers, threads = worker_layout(workers)
+            # spawn, not fork: TensorFlow is not fork-safe once initialised
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def predict_batch(tickers, look_back=60, forecast_days=5, model_type='lstm', forecast_mode='recursive'):
+    """
+    Runs train_and_predict for every ticker across a process pool and yields
+    each result as soon as it finishes (not in input order). Failed tickers
+    yield {'ticker', 'model', 'error'} instead of raising.
+    """
+    tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t and t.strip()))
+    if len(tickers) > BATCH_MAX_TICKERS:
+        raise ValueError(f"At most {BATCH_MAX_TICKERS} tickers can be predicted per batch.")
+
+    pool = get_pool()
+    futures = {
+        pool.submit(_predict_one, ticker, look_back, forecast_days, model_type, forecast_mode): ticker
+        for ticker in tickers
+    }
+    try:
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'ticker': futures[future], 'model': model_type, 'error': str(e)}
+    finally:
+        # Consumer went away (e.g. client disconnected), drop work that has not started
+        for future in futures:
+            future.cancel()
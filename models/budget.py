@@ -0,0 +1,151 @@
+"""
+Latency budgets for train_and_predict.
+
+A rough cost model turns (model type, history length, look_back, params,
+forecast days) into seconds. Each cost is a work count times a per-unit rate;
+the rates start from defaults measured on a small CPU box and are refined
+from every completed run in this process. plan() uses the estimate to decide
+what to run inside a budget: the requested model as is, the same model with
+fewer epochs/trees, a model trained on an earlier version of the data, or
+linear regression. Linear itself is always served as requested.
+"""
+import os
+import math
+import threading
+
+# Default budget in seconds when a request does not pass one (0 = unbounded)
+PREDICT_BUDGET_SECONDS = float(os.getenv('PREDICT_BUDGET_SECONDS', '0'))
+# Fetch, recommendation and serialisation, paid whatever model runs
+BASE_OVERHEAD_SECONDS = 0.2
+# Below these caps a degraded model is not worth training
+MIN_EPOCHS = 1
+MIN_TREES = 10
+
+# Seconds per unit of work (see _fit_work/_forecast_work), refined by observe()
+DEFAULT_FIT_RATES = {
+    'linear': 1.5e-9,
+    'random_forest': 5e-8,
+    'xgboost': 1.5e-7,
+    'lstm': 1.5e-8,
+    'gru': 1.2e-8,
+}
+DEFAULT_FORECAST_RATES = {
+    'linear': 5e-5,
+    'random_forest': 1e-4,
+    'xgboost': 1e-3,
+    'lstm': 7e-9,
+    'gru': 6e-9,
+}
+
+
+def _fit_work(model_type, n_windows, look_back, params):
+    if model_type == 'linear':
+        return n_windows * look_back ** 2
+    if model_type == 'random_forest':
+        return params['n_estimators'] * n_windows * math.log2(max(n_windows, 2)) * look_back
+    if model_type == 'xgboost':
+        return params['n_estimators'] * n_windows * look_back
+    # LSTM/GRU: every epoch runs each window through look_back steps of units x units matmuls
+    return params['epochs'] * n_windows * look_back * params['units'] ** 2
+
+
+def _cap_key(model_type):
+    return 'epochs' if model_type in ('lstm', 'gru') else 'n_estimators'
+
+
+def _quantise(units, minimum):
+    # Caps are rounded down to minimum * 2**k: a cap that followed every change of the
+    # rates would give each request its own params (and registry key) and never hit the cache
+    return minimum * 2 ** int(math.log2(units / minimum))
+
+
+def cap_steps(model_type, params):
+    """Every params a capped run can use, from the largest cap down"""
+    key = _cap_key(model_type)
+    if key not in params:
+        return []
+    minimum = MIN_EPOCHS if key == 'epochs' else MIN_TREES
+    units = _quantise(params[key], minimum) if params[key] >= minimum else 0
+    if units == params[key]:
+        units //= 2
+    steps = []
+    while units >= minimum:
+        steps.append(dict(params, **{key: units}))
+        units //= 2
+    return steps
+
+
+def _forecast_work(model_type, look_back, forecast_days, params):
+    if model_type == 'random_forest':
+        return forecast_days * params['n_estimators']
+    if model_type in ('lstm', 'gru'):
+        return forecast_days * look_back * params['units'] ** 2
+    return forecast_days
+
+
+class CostModel:
+    """Per-model seconds-per-unit rates, smoothed over observed runs"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.fit_rates = dict(DEFAULT_FIT_RATES)
+        self.forecast_rates = dict(DEFAULT_FORECAST_RATES)
+        self._lock = threading.Lock()
+
+    def estimate(self, model_type, n_windows, look_back, forecast_days, params, trained=False):
+        """Seconds for one run; trained=True skips the fit (model already cached)"""
+        seconds = BASE_OVERHEAD_SECONDS + self.forecast_rates[model_type] * _forecast_work(model_type, look_back, forecast_days, params)
+        if not trained:
+            seconds += self.fit_rates[model_type] * _fit_work(model_type, n_windows, look_back, params)
+        return seconds
+
+    def observe(self, model_type, n_windows, look_back, params, fit_seconds):
+        work = _fit_work(model_type, n_windows, look_back, params)
+        if work <= 0 or fit_seconds <= 0:
+            return
+        with self._lock:
+            rate = self.fit_rates[model_type]
+            self.fit_rates[model_type] = (1 - self.alpha) * rate + self.alpha * fit_seconds / work
+
+    def cap(self, model_type, n_windows, look_back, forecast_days, params, budget):
+        """params with epochs/trees reduced to fit the budget, or None if even the minimum does not fit"""
+        key = _cap_key(model_type)
+        if key not in params:
+            return None
+        unit = dict(params, **{key: 1})
+        fixed = self.estimate(model_type, n_windows, look_back, forecast_days, params, trained=True)
+        per_unit = self.fit_rates[model_type] * _fit_work(model_type, n_windows, look_back, unit)
+        units = int((budget - fixed) / per_unit) if per_unit > 0 else params[key]
+        minimum = MIN_EPOCHS if key == 'epochs' else MIN_TREES
+        if units < minimum:
+            return None
+        return dict(params, **{key: min(_quantise(units, minimum), params[key])})
+
+
+cost_model = CostModel()
+
+
+def plan(model_type, params, n_windows, look_back, forecast_days, budget, cached=False, has_previous=False):
+    """
+    Decides what to run within `budget` seconds. Returns a dict with the model type
+    and params to use, the estimate, and 'degraded' (None, 'capped', 'previous_model'
+    or 'fallback_linear').
+    """
+    estimate = cost_model.estimate(model_type, n_windows, look_back, forecast_days, params, trained=cached)
+    decision = {'model_type': model_type, 'params': params, 'estimated_seconds': estimate, 'degraded': None}
+    # Linear regression is the floor: there is nothing cheaper to degrade it to
+    if not budget or estimate <= budget or model_type == 'linear':
+        return decision
+
+    capped = cost_model.cap(model_type, n_windows, look_back, forecast_days, params, budget)
+    if capped is not None:
+        estimate = cost_model.estimate(model_type, n_windows, look_back, forecast_days, capped)
+        return dict(decision, params=capped, estimated_seconds=estimate, degraded='capped')
+
+    if has_previous:
+        # A model of the same kind trained on yesterday's data only needs to forecast
+        estimate = cost_model.estimate(model_type, n_windows, look_back, forecast_days, params, trained=True)
+        return dict(decision, estimated_seconds=estimate, degraded='previous_model')
+
+    estimate = cost_model.estimate('linear', n_windows, look_back, forecast_days, {})
+    return {'model_type': 'linear', 'params': {}, 'estimated_seconds': estimate, 'degraded': 'fallback_linear'}
@@ -0,0 +1,289 @@
+import os
+import re
+import json
+import time
+import threading
+import datetime
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process locks below apply
+    fcntl = None
+
+STORE_DIR = os.getenv('STOCK_STORE_DIR', os.path.join('data', 'store'))
+# How long a stored series is trusted before we ask the source for newer bars
+STORE_REFRESH_SECONDS = int(os.getenv('STOCK_STORE_REFRESH_SECONDS', '3600'))
+# Splits and dividends re-adjust the whole history upstream; refetch everything this often anyway
+STORE_FULL_REFRESH_DAYS = float(os.getenv('STOCK_STORE_FULL_REFRESH_DAYS', '7'))
+# Relative change of an already stored close that counts as a re-adjusted history
+STORE_ADJUST_TOLERANCE = 1e-4
+# Symbols as Yahoo writes them (BRK-B, ^GSPC, EURUSD=X); also keeps store paths inside STORE_DIR
+TICKER_PATTERN = re.compile(r'^[A-Z0-9.\-=^]{1,20}$')
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+# --- Data Sources ---
+class DataSource:
+    """
+    Interface for anything that can supply daily OHLCV bars.
+    fetch() returns a DataFrame indexed by date with the COLUMNS above,
+    or None/empty when nothing is available.
+    """
+    name = 'base'
+
+    def fetch(self, ticker, start=None, period='5y'):
+        raise NotImplementedError
+
+
+class YFinanceSource(DataSource):
+    """Downloads bars from Yahoo Finance"""
+    name = 'yfinance'
+
+    def fetch(self, ticker, start=None, period='5y'):
+        import yfinance as yf
+        stock = yf.Ticker(ticker)
+        if start is not None:
+            return stock.history(start=start.strftime('%Y-%m-%d'))
+        return stock.history(period=period)
+
+
+class LocalFileSource(DataSource):
+    """
+    Reads bars from CSV files named <TICKER>.csv in a directory.
+    The first column must be the date, followed by the OHLCV columns.
+    """
+    name = 'local'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start=None, period='5y'):
+        path = os.path.join(self.directory, f"{ticker.upper()}.csv")
+        if not os.path.exists(path):
+            return None
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        else:
+            df = df[df.index >= _period_start(period)]
+        return df
+
+
+_source = None
+
+
+def get_data_source():
+    """Returns the active data source (configured via STOCK_DATA_SOURCE)"""
+    global _source
+    if _source is None:
+        local_dir = os.getenv('STOCK_DATA_DIR')
+        if os.getenv('STOCK_DATA_SOURCE', 'yfinance') == 'local' and local_dir:
+            _source = LocalFileSource(local_dir)
+        else:
+            _source = YFinanceSource()
+    return _source
+
+
+def set_data_source(source):
+    """Replaces the active data source, e.g. with a LocalFileSource"""
+    global _source
+    _source = source
+
+
+# --- Helpers ---
+def _period_start(period, today=None):
+    """Converts a yfinance style period ('5y', '6mo', '30d', 'max') into a start date"""
+    today = pd.Timestamp(today or datetime.date.today())
+    if period == 'max':
+        return pd.Timestamp.min
+    if period.endswith('mo'):
+        return today - pd.DateOffset(months=int(period[:-2]))
+    if period.endswith('y'):
+        return today - pd.DateOffset(years=int(period[:-1]))
+    if period.endswith('wk'):
+        return today - pd.DateOffset(weeks=int(period[:-2]))
+    if period.endswith('d'):
+        return today - pd.DateOffset(days=int(period[:-1]))
+    if period == 'ytd':
+        return pd.Timestamp(year=today.year, month=1, day=1)
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def _normalize(df):
+    """Drops timezone info and extra columns so every frame in the store looks the same"""
+    df = df[[c for c in COLUMNS if c in df.columns]].copy()
+    for column in COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df.index = index.normalize()
+    df.index.name = 'Date'
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return df[COLUMNS].astype(np.float64)
+
+
+def validate_ticker(ticker):
+    """Upper-cased ticker, or ValueError for anything that is not a plain symbol ('..', 'a/b')"""
+    ticker = (ticker or '').strip().upper()
+    if not TICKER_PATTERN.match(ticker) or not ticker.strip('.'):
+        raise ValueError(f"Invalid ticker symbol '{ticker}'.")
+    return ticker
+
+
+def _ticker_dir(ticker):
+    return os.path.join(STORE_DIR, validate_ticker(ticker))
+
+
+def _ticker_lock(ticker):
+    with _locks_guard:
+        return _locks.setdefault(ticker.upper(), threading.Lock())
+
+
+@contextmanager
+def _file_lock(path, exclusive):
+    """
+    flock on <ticker dir>/.lock. The three store files are replaced one by one, and the
+    prefork workers and batch processes share them, so readers take it shared and
+    writers exclusive to never pair one version's dates with another's bars.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(path, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# --- Store ---
+def read_store(ticker):
+    """
+    Loads the stored bars for a ticker as a DataFrame backed by memory-mapped arrays.
+    Returns (df, meta) or (None, None) when the ticker has not been stored yet.
+    """
+    path = _ticker_dir(ticker)
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None, None
+    try:
+        # The maps keep pointing at this version's files after a writer replaces them
+        with _file_lock(path, exclusive=False):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            dates = np.load(os.path.join(path, 'dates.npy'), mmap_mode='r')
+            values = np.load(os.path.join(path, 'ohlcv.npy'), mmap_mode='r')
+    except Exception as e:
+        print(f"Error reading store for {ticker}: {e}")
+        return None, None
+    index = pd.DatetimeIndex(np.asarray(dates).astype('datetime64[ns]'), name='Date')
+    df = pd.DataFrame(values, index=index, columns=COLUMNS, copy=False)
+    return df, meta
+
+
+def write_store(ticker, df, meta):
+    """Replaces the stored bars for a ticker; readers see either the old or the new series, never a mix"""
+    path = _ticker_dir(ticker)
+    os.makedirs(path, exist_ok=True)
+    dates = df.index.values.astype('datetime64[ns]').astype(np.int64)
+    values = np.ascontiguousarray(df[COLUMNS].values, dtype=np.float64)
+    with _file_lock(path, exclusive=True):
+        # Write to temp files first so readers never see a half written series
+        for name, array in (('dates', dates), ('ohlcv', values)):
+            tmp = os.path.join(path, f"{name}.tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        tmp = os.path.join(path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+
+
+def _fetch_full(ticker, period, start, source, now):
+    """Downloads the whole period and replaces the stored series with it"""
+    fresh = source.fetch(ticker, period=period)
+    if fresh is None or fresh.empty:
+        return None
+    df = _normalize(fresh)
+    write_store(ticker, df, {
+        'source': source.name,
+        'first_requested': None if period == 'max' else str(start.date()),
+        'checked_at': now,
+        'full_fetched_at': now,
+    })
+    return df
+
+
+def _adjusted_since(stored, fresh):
+    """True when the source now reports different closes for bars we already stored (split, dividend)"""
+    overlap = fresh.index.intersection(stored.index[:-1])
+    if overlap.empty:
+        return False
+    old, new = stored.loc[overlap, 'Close'].values, fresh.loc[overlap, 'Close'].values
+    return not np.allclose(old, new, rtol=STORE_ADJUST_TOLERANCE, atol=0, equal_nan=True)
+
+
+def load_history(ticker, period='5y', source=None):
+    """
+    Returns daily bars for the requested period, reading the local store first
+    and only asking the data source for bars after the last stored date.
+    """
+    ticker = validate_ticker(ticker)
+    source = source or get_data_source()
+    start = _period_start(period)
+    with _ticker_lock(ticker):
+        stored, meta = read_store(ticker)
+        now = time.time()
+
+        covers_period = (
+            stored is not None and meta is not None
+            and meta.get('source') == source.name
+            and (meta.get('first_requested') is None
+                 or pd.Timestamp(meta['first_requested']) <= start)
+            and now - meta.get('full_fetched_at', 0) < STORE_FULL_REFRESH_DAYS * 86400
+        )
+
+        if not covers_period:
+            df = _fetch_full(ticker, period, start, source, now)
+            if df is None:
+                return None
+        elif now - meta.get('checked_at', 0) >= STORE_REFRESH_SECONDS:
+            # Top up from the last complete bar: it is compared with what we stored, the
+            # bar after it (the last one) may have been partial and is replaced anyway
+            anchor = stored.index[-2] if len(stored) > 1 else stored.index[-1]
+            try:
+                fresh = source.fetch(ticker, start=anchor)
+            except Exception as e:
+                print(f"Error refreshing {ticker}, serving stored data: {e}")
+                fresh = None
+            if fresh is not None and not fresh.empty:
+                fresh = _normalize(fresh)
+            if fresh is not None and not fresh.empty and _adjusted_since(stored, fresh):
+                # Stored bars were re-adjusted upstream, gluing new ones on would leave a price cliff
+                print(f"History of {ticker} was adjusted, refetching it")
+                df = _fetch_full(ticker, period, start, source, now)
+                if df is None:
+                    return None
+            else:
+                if fresh is not None and not fresh.empty:
+                    df = pd.concat([stored[stored.index < fresh.index[0]], fresh])
+                else:
+                    df = stored
+                meta['checked_at'] = now
+                write_store(ticker, df, meta)
+        else:
+            df = stored
+
+    df = df[df.index >= start]
+    if df.empty:
+        return None
+    return df
@@ -0,0 +1,158 @@
+import threading
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+RSI_WINDOW = 14
+SMA_WINDOW = 50
+
+
+class RollingMean:
+    """Mean of the last `window` values, updated in O(1) per value"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self._updates = 0
+
+    def push(self, value):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self._updates += 1
+        # Re-sum now and then so floating point drift cannot build up over years of bars
+        if self._updates % (self.window * 16) == 0:
+            self.total = float(sum(self.values))
+
+    @property
+    def mean(self):
+        if len(self.values) < self.window:
+            return np.nan
+        return self.total / self.window
+
+
+class IndicatorState:
+    """
+    Running RSI/SMA state for one series.
+    Mirrors calculate_rsi exactly, including pandas treating the first
+    (undefined) price change as a zero gain and a zero loss.
+    """
+
+    def __init__(self, rsi_window=RSI_WINDOW, sma_window=SMA_WINDOW):
+        self.gains = RollingMean(rsi_window)
+        self.losses = RollingMean(rsi_window)
+        self.sma = RollingMean(sma_window)
+        self.last_close = None
+        self.last_date = None
+
+    def push(self, close, date=None):
+        close = float(close)
+        if self.last_close is None:
+            delta = 0.0
+        else:
+            delta = close - self.last_close
+        self.gains.push(delta if delta > 0 else 0.0)
+        self.losses.push(-delta if delta < 0 else 0.0)
+        self.sma.push(close)
+        self.last_close = close
+        self.last_date = date
+
+    @property
+    def rsi(self):
+        return _rsi_from_means(self.gains.mean, self.losses.mean)
+
+    @property
+    def sma_value(self):
+        return self.sma.mean
+
+    @property
+    def warmup(self):
+        """Bars needed to fully determine both indicators from scratch"""
+        return max(self.gains.window + 1, self.sma.window)
+
+
+def _rsi_from_means(gain, loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = np.divide(gain, loss)
+        return 100 - (100 / (1 + rs))
+
+
+class IndicatorEngine:
+    """
+    Keeps an IndicatorState per ticker and brings it up to date with only
+    the bars it has not seen yet. If the stored last bar no longer matches
+    (e.g. a partial day was revised) the state is rebuilt from the last
+    few bars, which is still independent of the history length.
+    """
+
+    def __init__(self, rsi_window=RSI_WINDOW, sma_window=SMA_WINDOW):
+        self.rsi_window = rsi_window
+        self.sma_window = sma_window
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, ticker, df):
+        close = df['Close']
+        with self._lock:
+            state = self._states.get(ticker)
+            start = None
+            if state is not None and state.last_date is not None:
+                pos = close.index.searchsorted(state.last_date)
+                if pos < len(close) and close.index[pos] == state.last_date and close.iloc[pos] == state.last_close:
+                    start = pos + 1
+            if start is None:
+                state = IndicatorState(self.rsi_window, self.sma_window)
+                # Older bars cannot influence the indicators once this many newer ones are in
+                start = max(len(close) - state.warmup, 0)
+                if start > 0:
+                    # Re-seed the previous close so the first pushed bar gets a real delta
+                    state.last_close = float(close.iloc[start - 1])
+                self._states[ticker] = state
+            for date, value in zip(close.index[start:], close.values[start:]):
+                state.push(value, date)
+            return state
+
+    def latest(self, ticker, df):
+        """Returns (rsi, sma) for the last bar of df"""
+        state = self.update(ticker, df)
+        return float(state.rsi), float(state.sma_value)
+
+
+def latest_indicators(df, rsi_window=RSI_WINDOW, sma_window=SMA_WINDOW):
+    """(rsi, sma) for the last bar without keeping any state, using only the last few bars"""
+    return IndicatorEngine(rsi_window, sma_window).latest(None, df)
+
+
+# --- Vectorized panel path ---
+def _rolling_mean_2d(values, window):
+    """Trailing mean along axis 1, NaN until a full window is available (like pandas min_periods=window)"""
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] >= window:
+        out[:, window - 1:] = sliding_window_view(values, window, axis=1).mean(axis=-1)
+    return out
+
+
+def rsi_panel(closes, window=RSI_WINDOW):
+    """
+    RSI for a (tickers, bars) array of aligned closes in one vectorized pass.
+    Each row matches calculate_rsi(pd.Series(row)).
+    """
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    delta = np.full(closes.shape, np.nan)
+    delta[:, 1:] = np.diff(closes, axis=1)
+    # Same as pandas where(): NaN deltas count as neither gain nor loss
+    with np.errstate(invalid='ignore'):
+        gains = np.where(delta > 0, delta, 0.0)
+        losses = np.where(delta < 0, -delta, 0.0)
+    return _rsi_from_means(_rolling_mean_2d(gains, window), _rolling_mean_2d(losses, window))
+
+
+def sma_panel(closes, window=SMA_WINDOW):
+    """Simple moving average for a (tickers, bars) array of aligned closes"""
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    return _rolling_mean_2d(closes, window)
+
+
+engine = IndicatorEngine()
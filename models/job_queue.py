@@ -0,0 +1,127 @@
+import os
+import time
+import uuid
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from models.runtime import thread_budget, thread_limit
+
+PREDICT_WORKERS = int(os.getenv('PREDICT_WORKERS', '2'))
+PREDICT_MAX_PENDING = int(os.getenv('PREDICT_MAX_PENDING', '32'))
+# Finished jobs are kept around this long so clients can collect the result
+JOB_RESULT_TTL = int(os.getenv('PREDICT_JOB_TTL', '600'))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'elapsed': round((self.finished_at or time.time()) - self.created_at, 3),
+        }
+        if self.error:
+            data['error'] = self.error
+        if include_result and self.status == 'done':
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    Runs a function on a bounded thread pool and hands out job ids.
+    Submitting arguments that match a queued or running job returns that
+    job instead of starting a new one (single-flight).
+    """
+
+    def __init__(self, func, workers=PREDICT_WORKERS, max_pending=PREDICT_MAX_PENDING, ttl=JOB_RESULT_TTL):
+        self.func = func
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='predict')
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, *args):
+        key = args
+        with self._lock:
+            self._expire()
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                return self._jobs[job_id]
+            if len(self._in_flight) >= self.max_pending:
+                raise QueueFullError('Too many predictions in progress, please retry shortly.')
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job.id
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        """Number of queued or running jobs"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def run(self, *args, timeout=None):
+        """Submits and blocks until the job finishes"""
+        job = self.submit(*args)
+        job.done.wait(timeout)
+        return job
+
+    def _run(self, job):
+        job.status = 'running'
+
+        def progress(stage):
+            job.stage = stage
+
+        # Jobs run side by side, so each gets its share of the process thread budget for
+        # sklearn/XGBoost (TensorFlow's pools are process-wide and shared between them)
+        budget = thread_budget()
+        limit = thread_limit(max(1, budget // self.workers)) if budget else nullcontext()
+        try:
+            with limit:
+                result = self.func(*job.key, progress=progress)
+            if isinstance(result, dict) and 'error' in result:
+                job.error = result['error']
+                job.status = 'failed'
+            else:
+                job.result = result
+                job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._in_flight.pop(job.key, None)
+            job.done.set()
+
+    def _expire(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TICKERS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'TSLA', 'BTC-USD', 'ETH-USD', '^GSPC']
+MARKET_SUMMARY_TICKERS = [
+    t.strip().upper() for t in os.getenv('MARKET_SUMMARY_TICKERS', ','.join(DEFAULT_TICKERS)).split(',') if t.strip()
+]
+# Age after which the summary is refreshed in the background (the stale copy is still served)
+MARKET_SUMMARY_TTL = int(os.getenv('MARKET_SUMMARY_TTL', '60'))
+# Seconds between refreshes while anyone is subscribed to the stream
+MARKET_STREAM_INTERVAL = float(os.getenv('MARKET_STREAM_INTERVAL', '15'))
+# Updates buffered per subscriber before a slow one is reset to a single snapshot
+MARKET_STREAM_QUEUE = int(os.getenv('MARKET_STREAM_QUEUE', '8'))
+# Concurrent streams per process; beyond it clients are refused and poll instead
+MARKET_STREAM_MAX_CLIENTS = int(os.getenv('MARKET_STREAM_MAX_CLIENTS', '64'))
+# A stream is closed after this long so clients reconnect (and rebalance across workers)
+MARKET_STREAM_MAX_SECONDS = float(os.getenv('MARKET_STREAM_MAX_SECONDS', '600'))
+MARKET_STREAM_KEEPALIVE = float(os.getenv('MARKET_STREAM_KEEPALIVE', '15'))
+
+
+def _fetch_quote(ticker):
+    import yfinance as yf
+    try:
+        info = yf.Ticker(ticker).fast_info
+        price = info.last_price
+        prev_close = info.previous_close
+        change = price - prev_close
+        change_pct = (change / prev_close) * 100
+        return {
+            'ticker': ticker,
+            'price': price,
+            'change': change,
+            'change_pct': change_pct
+        }
+    except:
+        return None
+
+
+def fetch_market_summary(tickers=None):
+    """Fetches quotes for all tickers concurrently, skipping any that fail"""
+    tickers = tickers or MARKET_SUMMARY_TICKERS
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(tickers), 16)) as pool:
+            quotes = list(pool.map(_fetch_quote, tickers))
+    except Exception as e:
+        print(f"Error fetching market summary: {e}")
+        return []
+    return [q for q in quotes if q is not None]
+
+
+class MarketSummaryCache:
+    """
+    One shared copy of the market summary for every client.
+    Once populated, reads never wait on upstream: an expired copy is returned
+    immediately while a single background thread refreshes it.
+    """
+
+    def __init__(self, tickers=None, ttl=MARKET_SUMMARY_TTL, fetch=fetch_market_summary):
+        self.tickers = tickers or MARKET_SUMMARY_TICKERS
+        self.ttl = ttl
+        self.fetch = fetch
+        self.summary = None
+        self.updated_at = 0
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        if self.summary is None:
+            # Nothing to serve yet, the first caller fetches and the rest wait for it
+            with self._lock:
+                if self.summary is None:
+                    self._store(self.fetch(self.tickers))
+            return self.summary
+        if time.time() - self.updated_at >= self.ttl:
+            self._refresh_in_background()
+        return self.summary
+
+    def refresh(self):
+        """Fetches now, waiting for it, and returns the stored summary"""
+        summary = self.fetch(self.tickers)
+        with self._lock:
+            self._store(summary)
+        return self.summary
+
+    def _store(self, summary):
+        self.fetches += 1
+        # Keep the last good copy if upstream returned nothing at all
+        if summary or self.summary is None:
+            self.summary = summary
+        self.updated_at = time.time()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name='market-summary-refresh', daemon=True).start()
+
+
+summary_cache = MarketSummaryCache()
+
+
+def get_market_summary():
+    return summary_cache.get()
+
+
+# --- Streaming ---
+class StreamFullError(Exception):
+    pass
+
+
+class Subscription:
+    """One client's bounded queue of (event, quotes) messages"""
+
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.resets = 0
+
+
+class MarketTicker:
+    """
+    Fans the market summary out to stream subscribers. A single producer thread
+    refreshes the shared cache every `interval` seconds while anyone is listening
+    and broadcasts only the quotes that changed, so upstream calls do not grow
+    with the number of viewers. A subscriber that falls `queue_size` messages
+    behind has its backlog replaced by one full snapshot instead of growing.
+    """
+
+    def __init__(self, cache=summary_cache, interval=MARKET_STREAM_INTERVAL, queue_size=MARKET_STREAM_QUEUE,
+                 max_clients=MARKET_STREAM_MAX_CLIENTS):
+        self.cache = cache
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.quotes = {}
+        self.broadcasts = 0
+        self.resets = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._producer = None
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """New subscription whose first message is a snapshot of every quote known so far"""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                raise StreamFullError('Too many market streams open, poll /market-summary instead.')
+            if not self.quotes and self.cache.summary:
+                self.quotes = {q['ticker']: q for q in self.cache.summary}
+            if self.quotes:
+                subscription.queue.put_nowait(('snapshot', list(self.quotes.values())))
+            self._subscribers.add(subscription)
+            if self._producer is None:
+                self._producer = threading.Thread(target=self._run, name='market-ticker', daemon=True)
+                self._producer.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def events(self, subscription, keepalive=MARKET_STREAM_KEEPALIVE, max_seconds=MARKET_STREAM_MAX_SECONDS):
+        """Yields (event, quotes) as they arrive, (None, None) after `keepalive` idle seconds"""
+        deadline = time.monotonic() + max_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                yield subscription.queue.get(timeout=min(keepalive, remaining))
+            except queue.Empty:
+                yield None, None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody listening: stop polling upstream until the next subscribe()
+                    self._producer = None
+                    return
+            try:
+                summary = self.cache.refresh()
+                self._publish(summary or [])
+            except Exception as e:
+                print(f"Error refreshing market stream: {e}")
+            time.sleep(self.interval)
+
+    def _publish(self, summary):
+        with self._lock:
+            changed = [q for q in summary if self.quotes.get(q['ticker']) != q]
+            if not changed:
+                return
+            for q in changed:
+                self.quotes[q['ticker']] = q
+            self.broadcasts += 1
+            for subscription in self._subscribers:
+                try:
+                    subscription.queue.put_nowait(('update', changed))
+                except queue.Full:
+                    # Too slow to keep up: drop its backlog, one snapshot brings it current
+                    self._reset(subscription)
+
+    def _reset(self, subscription):
+        while True:
+            try:
+                subscription.queue.get_nowait()
+            except queue.Empty:
+                break
+        subscription.queue.put_nowait(('snapshot', list(self.quotes.values())))
+        subscription.resets += 1
+        self.resets += 1
+
+
+market_ticker = MarketTicker()
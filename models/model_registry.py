@@ -0,0 +1,248 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import joblib
+import numpy as np
+
+REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join('data', 'models'))
+REGISTRY_MAX_ENTRIES = int(os.getenv('MODEL_REGISTRY_MAX_ENTRIES', '32'))
+REGISTRY_MAX_MB = float(os.getenv('MODEL_REGISTRY_MAX_MB', '512'))
+
+DL_MODELS = ('lstm', 'gru')
+# 'numpy' serves saved LSTM/GRU models through their NumPy export, without importing TensorFlow
+DL_INFERENCE = os.getenv('DL_INFERENCE', 'keras')
+
+
+def data_fingerprint(df):
+    """Identifies the exact history a model was trained on (last bar date + hash of closes)"""
+    close = np.ascontiguousarray(df['Close'].values, dtype=np.float64)
+    digest = hashlib.sha1(close.tobytes()).hexdigest()[:12]
+    return f"{df.index[-1].strftime('%Y-%m-%d')}-{len(close)}-{digest}"
+
+
+def _fingerprint_order(fingerprint):
+    """(last bar date, bar count) of a data_fingerprint, which orders versions of a series"""
+    date, rest = fingerprint[:10], fingerprint[11:]
+    try:
+        return date, int(rest.split('-')[0])
+    except ValueError:
+        return date, 0
+
+
+def params_tag(params, defaults):
+    """Short hash of hyperparameters that differ from the defaults ('' when none do)"""
+    changed = {k: v for k, v in params.items() if defaults.get(k) != v}
+    if not changed:
+        return ''
+    return hashlib.sha1(json.dumps(changed, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def make_key(ticker, model_type, look_back, df, horizon=1, params=''):
+    # horizon > 1 identifies direct multi-output models, which are trained differently;
+    # params is a params_tag, so models with default settings keep their old keys
+    return (ticker.upper(), model_type, int(look_back), data_fingerprint(df), int(horizon), params)
+
+
+def _key_to_name(key):
+    ticker, model_type, look_back, fingerprint, horizon, params = key
+    safe = ticker.replace('/', '_').replace('\\', '_')
+    suffix = f"__p{params}" if params else ''
+    return f"{safe}__{model_type}__{look_back}__h{horizon}__{fingerprint}{suffix}"
+
+
+# --- Persistence ---
+def _save_model(model, model_type, base):
+    if model_type in DL_MODELS:
+        path = base + '.keras'
+        model.save(path)
+        try:
+            from models.numpy_inference import export_checked
+            export_checked(model, base + '.npz', model.input_shape[1])
+        except Exception as e:
+            print(f"Error exporting {base} for NumPy inference: {e}")
+    elif hasattr(model, 'save_model'):
+        # Plain XGBoost models; multi-output wrappers fall through to joblib
+        path = base + '.json'
+        model.save_model(path)
+    else:
+        path = base + '.joblib'
+        joblib.dump(model, path)
+    return path
+
+
+def _load_model(model_type, base):
+    if model_type in DL_MODELS and DL_INFERENCE == 'numpy' and os.path.exists(base + '.npz'):
+        from models.numpy_inference import load_numpy_model
+        return load_numpy_model(base + '.npz')
+    if model_type in DL_MODELS:
+        from tensorflow.keras.models import load_model
+        return load_model(base + '.keras')
+    if model_type == 'xgboost' and os.path.exists(base + '.json'):
+        import xgboost as xgb
+        model = xgb.XGBRegressor()
+        model.load_model(base + '.json')
+        return model
+    return joblib.load(base + '.joblib')
+
+
+class ModelRegistry:
+    """
+    Keeps trained models keyed by (ticker, model_type, look_back, fingerprint, horizon, params).
+
+    Entries are dicts holding the fitted 'model' plus whatever else is needed to
+    serve a prediction without retraining (scaler, test predictions, rmse...).
+    Memory holds an LRU bounded by entry count and bytes; every entry is also
+    written to disk so evicted or pre-restart models can be reloaded. On disk only
+    the newest fingerprint of each model is kept.
+    """
+
+    def __init__(self, directory=REGISTRY_DIR, max_entries=REGISTRY_MAX_ENTRIES, max_mb=REGISTRY_MAX_MB):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        entry, size = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry, size)
+        return entry
+
+    def put(self, key, entry):
+        try:
+            size = self._save(key, entry)
+        except Exception as e:
+            print(f"Error persisting model {key}: {e}")
+            size = 0
+        else:
+            self._prune(key)
+        with self._lock:
+            self._insert(key, entry, size)
+
+    def latest(self, key):
+        """
+        Newest entry trained on an earlier version of the same series: same ticker,
+        model, look_back, horizon and params but a different data fingerprint.
+        """
+        ticker, model_type, look_back, fingerprint, horizon, params = key
+        same_model = lambda k: k[:3] == key[:3] and k[4:] == key[4:] and k[3] != fingerprint
+        with self._lock:
+            candidates = {k[3] for k in self._entries if same_model(k)}
+        # Saved models from before a restart, found by file name
+        candidates.update(f for f in self._saved_fingerprints(key) if f != fingerprint)
+        # Fingerprints start with the last bar's date, so the newest sorts last
+        for candidate in sorted(candidates, reverse=True):
+            entry = self.get((ticker, model_type, look_back, candidate, horizon, params))
+            if entry is not None:
+                return entry
+        return None
+
+    def _saved_fingerprints(self, key):
+        """Fingerprints saved on disk for the same ticker, model, look_back, horizon and params"""
+        ticker, model_type, look_back, fingerprint, horizon, params = key
+        prefix = _key_to_name((ticker, model_type, look_back, '', horizon, ''))
+        suffix = f"__p{params}.meta.joblib" if params else '.meta.joblib'
+        found = set()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name.endswith(suffix):
+                    candidate = name[len(prefix):-len(suffix)]
+                    if '__' not in candidate:
+                        found.add(candidate)
+        return found
+
+    def _prune(self, key):
+        """
+        Deletes the models trained on older versions of the series once a newer one is
+        saved, so the directory holds one model per ticker/model/look_back/horizon/params.
+        """
+        # Only strictly older ones: a same-day fingerprint may be a revision another worker
+        # just saved, and which of two revisions of a bar is newer cannot be told apart
+        current = _fingerprint_order(key[3])
+        stale = {f for f in self._saved_fingerprints(key) if _fingerprint_order(f) < current}
+        for old in stale:
+            old_key = key[:3] + (old,) + key[4:]
+            with self._lock:
+                if old_key in self._entries:
+                    del self._entries[old_key]
+                    self._sizes.pop(old_key, None)
+            base = os.path.join(self.directory, _key_to_name(old_key))
+            for ext in ('.meta.joblib', '.keras', '.npz', '.json', '.joblib'):
+                try:
+                    os.remove(base + ext)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Error removing {base + ext}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(self._sizes.values()),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+    def _insert(self, key, entry, size):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+        # Evict least recently used entries, always keeping the newest one
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or sum(self._sizes.values()) > self.max_bytes
+        ):
+            old_key, _ = self._entries.popitem(last=False)
+            self._sizes.pop(old_key, None)
+
+    def _save(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, _key_to_name(key))
+        model_type = key[1]
+        model_path = _save_model(entry['model'], model_type, base)
+        meta = {k: v for k, v in entry.items() if k != 'model'}
+        joblib.dump(meta, base + '.meta.joblib')
+        # File size is a good enough stand-in for the in-memory footprint
+        return os.path.getsize(model_path) + os.path.getsize(base + '.meta.joblib')
+
+    def _load(self, key):
+        base = os.path.join(self.directory, _key_to_name(key))
+        if not os.path.exists(base + '.meta.joblib'):
+            return None, 0
+        try:
+            entry = joblib.load(base + '.meta.joblib')
+            entry['model'] = _load_model(key[1], base)
+        except Exception as e:
+            print(f"Error loading model {key}: {e}")
+            return None, 0
+        size = sum(
+            os.path.getsize(base + ext)
+            for ext in ('.meta.joblib', '.keras', '.npz', '.json', '.joblib')
+            if os.path.exists(base + ext)
+        )
+        return entry, size
+
+
+registry = ModelRegistry()
@@ -0,0 +1,219 @@
+"""
+Pure-NumPy inference for the Sequential LSTM/GRU/Dense networks built by
+prediction_engine.build_dl_model.
+
+export_keras() writes the layer specs and weights of a trained Keras model to
+a single .npz file; NumpyModel loads it back and runs the forward pass with
+NumPy only, so an inference-only process can serve cached models without
+importing TensorFlow. check_parity() compares both on random inputs.
+
+    python -m models.numpy_inference data/models/AAPL__lstm__60__h1__....keras
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+SUPPORTED_LAYERS = ('LSTM', 'GRU', 'Dense')
+PARITY_ATOL = 1e-4
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(x / 6.0 + 0.5, 0.0, 1.0)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'relu': lambda x: np.maximum(x, 0.0),
+}
+
+
+def _activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation '{name}'.")
+    return ACTIVATIONS[name]
+
+
+# --- Export ---
+def export_keras(model, path):
+    """Writes a trained Sequential model's layer specs and weights to one .npz file"""
+    specs, arrays = [], {}
+    for i, layer in enumerate(model.layers):
+        kind = layer.__class__.__name__
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError(f"Unsupported layer '{kind}'.")
+        config = layer.get_config()
+        spec = {
+            'type': kind,
+            'units': config['units'],
+            'activation': config.get('activation'),
+            'use_bias': config.get('use_bias', True),
+        }
+        if kind in ('LSTM', 'GRU'):
+            spec['recurrent_activation'] = config.get('recurrent_activation', 'sigmoid')
+            spec['return_sequences'] = config.get('return_sequences', False)
+        if kind == 'GRU':
+            spec['reset_after'] = config.get('reset_after', True)
+        weights = layer.get_weights()
+        spec['weights'] = len(weights)
+        for j, w in enumerate(weights):
+            arrays[f'layer{i}_{j}'] = np.asarray(w, dtype=np.float32)
+        specs.append(spec)
+    np.savez_compressed(path, spec=np.array(json.dumps(specs)), **arrays)
+    return path
+
+
+# --- Forward pass ---
+class NumpyModel:
+    """A loaded export; predict() mirrors keras Model.predict for (batch, steps, features) inputs"""
+
+    def __init__(self, specs, weights):
+        self.specs = specs
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            specs = json.loads(str(data['spec']))
+            weights = [[data[f'layer{i}_{j}'] for j in range(spec['weights'])] for i, spec in enumerate(specs)]
+        return cls(specs, weights)
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        for spec, weights in zip(self.specs, self.weights):
+            if spec['type'] == 'LSTM':
+                x = self._lstm(spec, weights, x)
+            elif spec['type'] == 'GRU':
+                x = self._gru(spec, weights, x)
+            else:
+                x = self._dense(spec, weights, x)
+        return x
+
+    __call__ = predict
+
+    @staticmethod
+    def _dense(spec, weights, x):
+        out = x @ weights[0]
+        if spec['use_bias']:
+            out = out + weights[1]
+        return _activation(spec['activation'])(out)
+
+    @staticmethod
+    def _lstm(spec, weights, x):
+        kernel, recurrent = weights[0], weights[1]
+        bias = weights[2] if spec['use_bias'] else 0.0
+        act, rec_act = _activation(spec['activation']), _activation(spec['recurrent_activation'])
+        u = spec['units']
+        batch, steps, _ = x.shape
+        # Input projections for every timestep in one matmul; only h @ U stays in the loop
+        projected = x @ kernel + bias
+        h = np.zeros((batch, u), dtype=np.float32)
+        c = np.zeros((batch, u), dtype=np.float32)
+        outputs = []
+        for t in range(steps):
+            z = projected[:, t] + h @ recurrent
+            # Keras gate order: input, forget, cell, output
+            i, f = rec_act(z[:, :u]), rec_act(z[:, u:2 * u])
+            c = f * c + i * act(z[:, 2 * u:3 * u])
+            h = rec_act(z[:, 3 * u:]) * act(c)
+            if spec['return_sequences']:
+                outputs.append(h)
+        return np.stack(outputs, axis=1) if spec['return_sequences'] else h
+
+    @staticmethod
+    def _gru(spec, weights, x):
+        kernel, recurrent = weights[0], weights[1]
+        act, rec_act = _activation(spec['activation']), _activation(spec['recurrent_activation'])
+        u = spec['units']
+        if not spec['use_bias']:
+            input_bias = recurrent_bias = 0.0
+        elif spec['reset_after']:
+            input_bias, recurrent_bias = weights[2][0], weights[2][1]
+        else:
+            input_bias, recurrent_bias = weights[2], 0.0
+        batch, steps, _ = x.shape
+        projected = x @ kernel + input_bias
+        h = np.zeros((batch, u), dtype=np.float32)
+        outputs = []
+        for t in range(steps):
+            xz, xr, xh = projected[:, t, :u], projected[:, t, u:2 * u], projected[:, t, 2 * u:]
+            # Keras gate order: update, reset, candidate
+            if spec['reset_after']:
+                inner = h @ recurrent + recurrent_bias
+                z = rec_act(xz + inner[:, :u])
+                r = rec_act(xr + inner[:, u:2 * u])
+                candidate = act(xh + r * inner[:, 2 * u:])
+            else:
+                inner = h @ recurrent[:, :2 * u]
+                z = rec_act(xz + inner[:, :u])
+                r = rec_act(xr + inner[:, u:])
+                candidate = act(xh + (r * h) @ recurrent[:, 2 * u:])
+            h = z * h + (1.0 - z) * candidate
+            if spec['return_sequences']:
+                outputs.append(h)
+        return np.stack(outputs, axis=1) if spec['return_sequences'] else h
+
+
+def load_numpy_model(path):
+    return NumpyModel.load(path)
+
+
+# --- Parity ---
+def check_parity(model, numpy_model, look_back, samples=32, seed=0):
+    """Largest absolute difference between Keras and NumPy outputs on random [0, 1] windows"""
+    x = np.random.default_rng(seed).random((samples, look_back, 1), dtype=np.float32)
+    expected = np.asarray(model(x, training=False))
+    return float(np.max(np.abs(expected - numpy_model.predict(x))))
+
+
+def export_checked(model, path, look_back, atol=PARITY_ATOL):
+    """Exports and reloads the model; raises ValueError when the outputs do not match Keras"""
+    export_keras(model, path)
+    numpy_model = load_numpy_model(path)
+    diff = check_parity(model, numpy_model, look_back)
+    if diff > atol:
+        raise ValueError(f"NumPy export differs from Keras by {diff:.2e} (tolerance {atol:.0e}).")
+    return numpy_model
+
+
+def _per_step(func, look_back, repeat=200):
+    window = np.random.default_rng(1).random((1, look_back, 1), dtype=np.float32)
+    func(window)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(window)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='saved .keras model')
+    parser.add_argument('--output', help='export path (default: next to the model, .npz)')
+    args = parser.parse_args(argv)
+
+    from tensorflow.keras.models import load_model
+    from models.prediction_engine import keras_infer
+    model = load_model(args.model)
+    look_back = model.input_shape[1]
+    output = args.output or args.model.rsplit('.', 1)[0] + '.npz'
+    try:
+        numpy_model = export_checked(model, output, look_back)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Exported {output}, max difference {check_parity(model, numpy_model, look_back):.2e}")
+    print(f"keras (tf.function) {_per_step(lambda w: keras_infer(model, w), look_back) * 1e6:10.1f} us/step")
+    print(f"numpy               {_per_step(numpy_model.predict, look_back) * 1e6:10.1f} us/step")
+
+
+if __name__ == '__main__':
+    main()
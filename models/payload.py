@@ -0,0 +1,108 @@
+import os
+import base64
+import bisect
+import numpy as np
+
+PAYLOAD_FORMATS = ('json', 'columnar')
+# Upper bound on max_points so a client cannot ask for pathological bucket counts
+PAYLOAD_MAX_POINTS = int(os.getenv('PAYLOAD_MAX_POINTS', '5000'))
+
+# (date column, value column) pairs in a train_and_predict result
+SERIES = (('dates', 'actual_prices'), ('test_dates', 'test_predictions'))
+# Only the price history is the same between runs; test predictions change with every model
+DELTA_SERIES = ('dates',)
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def lttb(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indices of the
+    `threshold` points that best keep the visual shape of the series; the
+    first and last points are always kept.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Interior points split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    x = np.arange(n, dtype=np.float64)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle corner
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = values[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (values[start:end] - values[a])
+            - (x[a] - x[start:end]) * (avg_y - values[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def to_epoch_days(dates):
+    """'YYYY-MM-DD' strings -> int days since 1970-01-01"""
+    return (np.asarray(dates, dtype='datetime64[D]') - EPOCH).astype(np.int64)
+
+
+def encode_float32(values):
+    """Little-endian float32 bytes as base64 (read with new Float32Array(bytes.buffer))"""
+    return base64.b64encode(np.asarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+def decode_float32(data):
+    return np.frombuffer(base64.b64decode(data), dtype='<f4')
+
+
+def shape_payload(result, since=None, max_points=None, fmt='json'):
+    """
+    Trims a train_and_predict result for the wire without touching the original
+    (cached job results are shared between clients).
+
+    since:      price history is only sent from this 'YYYY-MM-DD' date on, inclusive,
+                since the last bar may have been revised intraday (delta mode);
+                the client replaces its bars from that date with the ones sent
+    max_points: each historical series is LTTB-downsampled to at most this many points
+    fmt:        'json' keeps lists of strings and floats, 'columnar' sends dates as
+                epoch-day ints and prices as base64 float32 arrays
+    """
+    if not isinstance(result, dict) or 'error' in result or 'dates' not in result:
+        return result
+    if fmt not in PAYLOAD_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'.")
+    if max_points is not None:
+        max_points = max(3, min(int(max_points), PAYLOAD_MAX_POINTS))
+
+    payload = dict(result)
+    for date_key, value_key in SERIES:
+        dates, values = result[date_key], result[value_key]
+        if since and date_key in DELTA_SERIES:
+            # ISO dates sort lexicographically, so bisect works on the strings
+            start = bisect.bisect_left(dates, since)
+            dates, values = dates[start:], values[start:]
+        if max_points and len(dates) > max_points:
+            keep = lttb(values, max_points)
+            dates = [dates[i] for i in keep]
+            values = [values[i] for i in keep]
+        payload[date_key], payload[value_key] = dates, values
+
+    if since:
+        payload['delta'] = {'since': since, 'bars': len(payload['dates'])}
+    if max_points:
+        payload['downsampled'] = max_points
+
+    if fmt == 'columnar':
+        payload['format'] = 'columnar'
+        for date_key, value_key in SERIES + (('future_dates', 'future_predictions'),):
+            payload[date_key] = to_epoch_days(payload[date_key]).tolist()
+            payload[value_key] = encode_float32(payload[value_key])
+    return payload
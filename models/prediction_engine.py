@@ -1,21 +1,28 @@
+import os
+import time
 import numpy as np
 import pandas as pd
-import yfinance as yf
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, GRU, Dense
-import xgboost as xgb
 import datetime
+import weakref
+from models.data_store import load_history
+from models.windows import build_windows, as_sequence, window_count, WINDOW_DTYPE
+from models.model_registry import registry, make_key, params_tag, DL_MODELS
+from models.runtime import thread_budget, thread_limit, cpu_count
+from models.market_summary import get_market_summary
+from models.indicators import engine as indicator_engine, latest_indicators
+# Model libraries (TensorFlow, scikit-learn, XGBoost) are imported on first use, see models/backends.py
+from models.backends import get_backend, MODEL_TYPES
+from models.sweep import load_best_config
+from models.numpy_inference import NumpyModel
+from models.budget import cost_model, plan as plan_budget, cap_steps, PREDICT_BUDGET_SECONDS, BASE_OVERHEAD_SECONDS
+from metrics import StageTimer, stage, predict_seconds
 
 # Common Data Fetching & Analysis
 def get_stock_data(ticker, period='5y'):
     try:
-        stock = yf.Ticker(ticker)
-        df = stock.history(period=period)
-        if df.empty:
+        # Served from the local store, only bars newer than the last stored date are downloaded
+        df = load_history(ticker, period=period)
+        if df is None or df.empty:
             return None
         return df
     except Exception as e:
@@ -30,35 +37,13 @@ def calculate_rsi(data, window=14):
     rsi = 100 - (100 / (1 + rs))
     return rsi
 
-def get_market_summary():
-    tickers = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'TSLA', 'BTC-USD', 'ETH-USD', '^GSPC']
-    summary = []
-    try:
-        for ticker in tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                info = stock.fast_info
-                price = info.last_price
-                prev_close = info.previous_close
-                change = price - prev_close
-                change_pct = (change / prev_close) * 100
-                summary.append({
-                    'ticker': ticker,
-                    'price': price,
-                    'change': change,
-                    'change_pct': change_pct
-                })
-            except:
-                continue
-    except Exception as e:
-        print(f"Error fetching market summary: {e}")
-    return summary
-
-def get_recommendation(df):
+def get_recommendation(df, ticker=None):
     close = df['Close']
-    rsi_series = calculate_rsi(close)
-    current_rsi = rsi_series.iloc[-1]
-    sma_50 = close.rolling(window=50).mean().iloc[-1]
+    # Only the newest bars are needed; with a ticker the rolling state is kept between calls
+    if ticker:
+        current_rsi, sma_50 = indicator_engine.latest(ticker.upper(), df)
+    else:
+        current_rsi, sma_50 = latest_indicators(df)
     current_price = close.iloc[-1]
     
     signals = []
@@ -106,149 +91,762 @@ def get_recommendation(df):
     }
 
 # --- Data Preparation ---
-def prepare_sequence_data(data, look_back=60):
+def prepare_sequence_data(data, look_back=60, horizon=1):
     """Prepares data for LSTM/GRU (3D array)"""
-    dataset = data['Close'].values.reshape(-1, 1)
+    from sklearn.preprocessing import MinMaxScaler
+    dataset = data['Close'].values.astype(WINDOW_DTYPE).reshape(-1, 1)
     scaler = MinMaxScaler(feature_range=(0, 1))
     scaled_data = scaler.fit_transform(dataset)
     
-    X, y = [], []
-    for i in range(look_back, len(scaled_data)):
-        X.append(scaled_data[i-look_back:i, 0])
-        y.append(scaled_data[i, 0])
-        
-    X, y = np.array(X), np.array(y)
-    X = np.reshape(X, (X.shape[0], X.shape[1], 1))
+    # Strided views over scaled_data, nothing is copied until the model consumes it
+    X, y = build_windows(scaled_data, look_back, horizon=horizon)
+    X = as_sequence(X)
     return X, y, scaler, scaled_data
 
-def prepare_flat_data(data, look_back=60):
+def prepare_flat_data(data, look_back=60, horizon=1):
     """Prepares data for ML models (2D array)"""
     dataset = data['Close'].values
-    X, y = [], []
-    for i in range(look_back, len(dataset)):
-        X.append(dataset[i-look_back:i])
-        y.append(dataset[i])
-    X, y = np.array(X), np.array(y)
+    X, y = build_windows(dataset, look_back, horizon=horizon)
     return X, y
 
+# --- Inference ---
+_inference_fns = weakref.WeakKeyDictionary()
+
+def keras_infer(model, batch):
+    """
+    Runs one forward pass through a traced tf.function of the model.
+    model.predict sets up a data pipeline on every call, which dominates
+    the cost of the tiny (1, look_back, 1) inputs used when forecasting.
+    Models loaded from a NumPy export run without TensorFlow.
+    """
+    if isinstance(model, NumpyModel):
+        return model.predict(batch)
+    tf = get_backend('lstm').tf
+    fn = _inference_fns.get(model)
+    if fn is None:
+        model_ref = weakref.ref(model)
+        fn = tf.function(lambda x: model_ref()(x, training=False), reduce_retracing=True)
+        _inference_fns[model] = fn
+    return fn(tf.constant(batch, dtype=tf.float32)).numpy()
+
+def recursive_forecast(step, last_window, forecast_days):
+    """
+    Feeds each prediction back in as the newest input.
+    Windows are views into one preallocated buffer instead of np.append copies.
+    """
+    look_back = len(last_window)
+    buffer = np.empty(look_back + forecast_days, dtype=WINDOW_DTYPE)
+    buffer[:look_back] = last_window
+    for i in range(forecast_days):
+        buffer[look_back + i] = step(buffer[i:i + look_back])
+    return buffer[look_back:]
+
+# --- Hyperparameters ---
+# Defaults for every model type; a sweep (models/sweep.py) can find better ones per ticker
+# LSTM/GRU epochs and batch_size left as None follow DL_TRAINING (see dl_fit_settings)
+DEFAULT_PARAMS = {
+    'lstm': {'units': 50, 'epochs': None, 'batch_size': None},
+    'gru': {'units': 50, 'epochs': None, 'batch_size': None},
+    'linear': {},
+    'random_forest': {'n_estimators': 100, 'max_depth': None},
+    'xgboost': {'n_estimators': 100, 'max_depth': None, 'learning_rate': None},
+}
+
+def model_params(model_type, params=None):
+    """Defaults for model_type overridden by params; unknown keys are rejected"""
+    defaults = DEFAULT_PARAMS[model_type]
+    unknown = set(params or {}) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {model_type}: {', '.join(sorted(unknown))}")
+    return {**defaults, **(params or {})}
+
 # --- Deep Learning Models ---
-def run_dl_model(df, look_back, forecast_days, model_type='lstm'):
-    X, y, scaler, scaled_data = prepare_sequence_data(df, look_back)
-    training_size = int(len(X) * 0.8)
-    X_train, X_test = X[:training_size], X[training_size:]
-    y_train, y_test = y[:training_size], y[training_size:]
-    
-    model = Sequential()
+def build_dl_model(model_type, look_back, horizon=1, units=50):
+    """Compiled, untrained LSTM/GRU network"""
+    keras = get_backend(model_type)
+    model = keras.Sequential()
     if model_type == 'lstm':
-        model.add(LSTM(units=50, return_sequences=True, input_shape=(X_train.shape[1], 1)))
-        model.add(LSTM(units=50, return_sequences=False))
+        model.add(keras.LSTM(units=units, return_sequences=True, input_shape=(look_back, 1)))
+        model.add(keras.LSTM(units=units, return_sequences=False))
     elif model_type == 'gru':
-        model.add(GRU(units=50, return_sequences=True, input_shape=(X_train.shape[1], 1)))
-        model.add(GRU(units=50, return_sequences=False))
+        model.add(keras.GRU(units=units, return_sequences=True, input_shape=(look_back, 1)))
+        model.add(keras.GRU(units=units, return_sequences=False))
         
-    model.add(Dense(units=25))
-    model.add(Dense(units=1))
+    model.add(keras.Dense(units=25))
+    model.add(keras.Dense(units=horizon))
     model.compile(optimizer='adam', loss='mean_squared_error')
+    return model
+
+# 'pipeline' trains from a prefetching tf.data pipeline with early stopping,
+# 'classic' is a plain model.fit for a fixed number of epochs
+DL_TRAINING = os.getenv('DL_TRAINING', 'pipeline')
+DL_BATCH_SIZE = int(os.getenv('DL_BATCH_SIZE', '128'))
+DL_MAX_EPOCHS = int(os.getenv('DL_MAX_EPOCHS', '30'))
+CLASSIC_BATCH_SIZE, CLASSIC_EPOCHS = 32, 5
+DL_MIN_EPOCHS = int(os.getenv('DL_MIN_EPOCHS', '2'))
+DL_PATIENCE = int(os.getenv('DL_PATIENCE', '3'))
+# Most recent share of the training windows held out to watch the validation loss
+DL_VALIDATION_SPLIT = float(os.getenv('DL_VALIDATION_SPLIT', '0.1'))
+
+def dl_fit_settings(model_type, params, pipeline=True):
+    """
+    (batch_size, max_epochs) fit_dl_model trains params with, in pipeline or classic mode.
+    Values set in params (a sweep's, a budget cap) are used as given; None picks the mode's default.
+    """
+    pipeline = pipeline and DL_TRAINING == 'pipeline'
+    batch_size = params.get('batch_size') or (DL_BATCH_SIZE if pipeline else CLASSIC_BATCH_SIZE)
+    max_epochs = params.get('epochs') or (DL_MAX_EPOCHS if pipeline else CLASSIC_EPOCHS)
+    return batch_size, max_epochs
+
+def fit_dl_model(model, X_train, y_train, model_type, params):
+    """
+    Trains in place and returns a summary (mode, epochs run, batch size, samples/sec).
+    In pipeline mode, batches come from a shuffled, prefetched tf.data.Dataset and
+    training runs until the validation loss stops improving (DL_PATIENCE epochs,
+    at least DL_MIN_EPOCHS, at most DL_MAX_EPOCHS or params['epochs']), keeping the best
+    weights. See dl_fit_settings for how params and the env settings combine.
+    """
+    X_train = np.ascontiguousarray(X_train, dtype=WINDOW_DTYPE)
+    y_train = np.ascontiguousarray(y_train, dtype=WINDOW_DTYPE)
+    val_size = int(len(X_train) * DL_VALIDATION_SPLIT)
+    
+    start = time.perf_counter()
+    if DL_TRAINING == 'pipeline' and val_size >= 16:
+        tf = get_backend(model_type).tf
+        batch_size, max_epochs = dl_fit_settings(model_type, params)
+        # Validation is the end of the training range, so it is never earlier than what the model learns from
+        split = len(X_train) - val_size
+        train = (tf.data.Dataset.from_tensor_slices((X_train[:split], y_train[:split]))
+                 .shuffle(split, seed=42, reshuffle_each_iteration=True)
+                 .batch(batch_size)
+                 .prefetch(tf.data.AUTOTUNE))
+        validation = (tf.data.Dataset.from_tensor_slices((X_train[split:], y_train[split:]))
+                      .batch(batch_size * 4)
+                      .prefetch(tf.data.AUTOTUNE))
+        stopper = tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss', patience=DL_PATIENCE, min_delta=1e-6,
+            restore_best_weights=True, start_from_epoch=DL_MIN_EPOCHS,
+        )
+        history = model.fit(train, validation_data=validation, epochs=max_epochs, callbacks=[stopper], verbose=0)
+        epochs, samples = len(history.history['loss']), split
+        # The restored weights' loss; warm-up epochs before DL_MIN_EPOCHS are never restored,
+        # and a run shorter than that keeps its last weights
+        val_loss = stopper.best if np.isfinite(stopper.best) else history.history['val_loss'][-1]
+        summary = {
+            'mode': 'pipeline',
+            'stopped_early': epochs < max_epochs,
+            'val_loss': float(val_loss),
+        }
+    else:
+        (batch_size, epochs), samples = dl_fit_settings(model_type, params, pipeline=False), len(X_train)
+        model.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, verbose=0)
+        summary = {'mode': 'classic'}
+    seconds = time.perf_counter() - start
+    summary.update({
+        'epochs': epochs,
+        'batch_size': batch_size,
+        'fit_seconds': round(seconds, 4),
+        'samples_per_sec': round(epochs * samples / seconds, 1) if seconds else None,
+    })
+    return summary
+
+def train_dl_model(df, look_back, model_type='lstm', horizon=1, params=None, prepared=None):
+    """
+    Fits an LSTM/GRU and scores it on the last 20%. Returns a registry entry.
+    horizon > 1 trains a direct multi-output head that emits every forecast day at once.
+    prepared: the prepare_sequence_data output when it has already been built (ensembles)
+    """
+    from sklearn.metrics import mean_squared_error
+    params = model_params(model_type, params)
+    with stage('windowing'):
+        X, y, scaler, scaled_data = prepared or prepare_sequence_data(df, look_back, horizon)
+    training_size = int(len(X) * 0.8)
+    X_train, X_test = X[:training_size], X[training_size:]
+    y_train, y_test = y[:training_size], y[training_size:]
     
-    model.fit(X_train, y_train, batch_size=32, epochs=5, verbose=0)
+    model = build_dl_model(model_type, look_back, horizon, params['units'])
     
-    predictions = model.predict(X_test, verbose=0)
+    with stage('fit'):
+        training = fit_dl_model(model, X_train, y_train, model_type, params)
+    
+    # Test metrics use the next-day output so recursive and direct runs are comparable
+    with stage('test_predict'):
+        predictions = model.predict(X_test, verbose=0)[:, :1]
     predictions = scaler.inverse_transform(predictions)
-    y_test_scaled = scaler.inverse_transform(y_test.reshape(-1, 1))
+    y_test_scaled = scaler.inverse_transform(y_test.reshape(len(y_test), -1)[:, :1])
     
     mse = mean_squared_error(y_test_scaled, predictions)
     rmse = np.sqrt(mse)
     
-    # Future
-    last_sequence = scaled_data[-look_back:]
-    curr_sequence = last_sequence.reshape(1, look_back, 1)
-    future_predictions = []
+    return {
+        'model': model,
+        'scaler': scaler,
+        'horizon': horizon,
+        'params': params,
+        'predictions': predictions,
+        'rmse': float(rmse),
+        'test_start_idx': look_back + training_size,
+        'training': training,
+        # Bookkeeping for fine_tune_dl_model
+        'trained_until': df.index[-1].strftime('%Y-%m-%d'),
+        'trained_tail': _series_tail(df),
+        'full_trained_at': time.time(),
+        'updates': 0,
+    }
+
+# Cached LSTM/GRU models are updated on new bars instead of retrained (0 = always retrain)
+DL_FINE_TUNE = os.getenv('DL_FINE_TUNE', '1') == '1'
+DL_FINE_TUNE_EPOCHS = int(os.getenv('DL_FINE_TUNE_EPOCHS', '2'))
+# Older windows mixed into each update so the model does not forget the rest of the history
+DL_REPLAY_SIZE = int(os.getenv('DL_REPLAY_SIZE', '256'))
+# Full retrain once any of these is exceeded
+DL_MAX_NEW_BARS = int(os.getenv('DL_MAX_NEW_BARS', '20'))
+DL_FULL_RETRAIN_DAYS = float(os.getenv('DL_FULL_RETRAIN_DAYS', '7'))
+DL_DRIFT_RANGE = float(os.getenv('DL_DRIFT_RANGE', '0.25'))
+DL_DRIFT_ERROR_RATIO = float(os.getenv('DL_DRIFT_ERROR_RATIO', '3'))
+
+def rescale_dl_model(model, old_range, new_range):
+    """
+    Rewrites the first and last layers so the network gives the same prices under a
+    wider MinMax range. With x_old = k * x_new + c, the input kernel is multiplied by k
+    (c folded into the input bias) and the output becomes (y_old - c) / k.
+    """
+    (lo, hi), (new_lo, new_hi) = old_range, new_range
+    k = (new_hi - new_lo) / (hi - lo)
+    c = (new_lo - lo) / (hi - lo)
+    first, last = model.layers[0], model.layers[-1]
+    kernel, recurrent, bias = first.get_weights()
+    if bias.ndim == 2:
+        # GRU with reset_after keeps separate input and recurrent biases, row 0 is the input one
+        bias[0] += c * kernel[0]
+    else:
+        bias += c * kernel[0]
+    first.set_weights([kernel * k, recurrent, bias])
+    weights, out_bias = last.get_weights()
+    last.set_weights([weights / k, (out_bias - c) / k])
+
+# Closing prices kept with each LSTM/GRU entry to tell a revised last bar from a rewritten history
+DL_TAIL_BARS = 5
+
+def _series_tail(df):
+    tail = df['Close'].iloc[-DL_TAIL_BARS:]
+    return {date.strftime('%Y-%m-%d'): float(close) for date, close in tail.items()}
+
+def _revised_bars(tail, df, trained_until):
+    """
+    1 if only the last trained bar's close changed, 0 if none did, None if an earlier
+    stored bar changed or is gone. Entries saved without a tail count as unchanged.
+    """
+    if not tail:
+        return 0
+    closes = df['Close']
+    revised = 0
+    for date, close in tail.items():
+        timestamp = pd.Timestamp(date)
+        if timestamp not in closes.index:
+            return None
+        if not np.isclose(closes.loc[timestamp], close, rtol=1e-6, atol=0):
+            if date != trained_until:
+                return None
+            revised = 1
+    return revised
+
+def fine_tune_dl_model(previous, df, look_back, model_type):
+    """
+    Updates a model trained on an earlier version of this series with the bars added
+    since, plus a replay sample of older windows. Returns (entry, None), or
+    (None, reason) when a full retrain is due (too stale, too many new bars, drift).
+    """
+    from sklearn.preprocessing import MinMaxScaler
+    from sklearn.metrics import mean_squared_error
+    tf = get_backend(model_type).tf
+    horizon, params = previous.get('horizon', 1), previous['params']
+    if 'trained_until' not in previous:
+        return None, 'no update history'
+    if isinstance(previous['model'], NumpyModel):
+        return None, 'inference-only model'
+    if time.time() - previous['full_trained_at'] > DL_FULL_RETRAIN_DAYS * 86400:
+        return None, 'stale'
+    new_bars = int((df.index > pd.Timestamp(previous['trained_until'])).sum())
+    if new_bars > DL_MAX_NEW_BARS:
+        return None, 'too many new bars'
+    # The last trained bar may have been partial and revised since (same date, new close);
+    # it is updated on like a new bar, a change to any earlier one is a rewritten history
+    revised = _revised_bars(previous.get('trained_tail'), df, previous['trained_until'])
+    if revised is None or new_bars + revised == 0:
+        return None, 'history changed'
+    updated = new_bars + revised
+    
+    close = df['Close'].values.astype(WINDOW_DTYPE)
+    scaler = previous['scaler']
+    lo, hi = float(scaler.data_min_[0]), float(scaler.data_max_[0])
+    new_lo, new_hi = min(lo, float(close[-updated:].min())), max(hi, float(close[-updated:].max()))
+    if (lo - new_lo + new_hi - hi) / (hi - lo) > DL_DRIFT_RANGE:
+        return None, 'price range drift'
+    
+    # Work on a copy, the previous entry may be serving other requests
+    model = tf.keras.models.clone_model(previous['model'])
+    model.set_weights(previous['model'].get_weights())
+    model.compile(optimizer='adam', loss='mean_squared_error')
+    if (new_lo, new_hi) != (lo, hi):
+        rescale_dl_model(model, (lo, hi), (new_lo, new_hi))
+        scaler = MinMaxScaler(feature_range=(0, 1)).fit(np.array([[new_lo], [new_hi]]))
+    scale = lambda values: scaler.transform(values.reshape(-1, 1)).reshape(values.shape).astype(WINDOW_DTYPE)
     
-    for _ in range(forecast_days):
-        next_pred = model.predict(curr_sequence, verbose=0)
-        future_predictions.append(next_pred[0, 0])
-        next_val = next_pred.reshape(1, 1, 1)
-        curr_sequence = np.append(curr_sequence[:, 1:, :], next_val, axis=1)
+    # Raw strided views; only the windows picked below get copied and scaled
+    X_all, y_all = build_windows(close, look_back, horizon=horizon)
+    n = len(X_all)
+    new_idx = np.arange(max(0, n - updated), n)
+    # Same 80/20 split as train_dl_model; only the training range is replayed
+    training_size = int(n * 0.8)
+    with stage('fine_tune'):
+        # Error on the new bars before updating is an honest out-of-sample check for drift
+        before = model.predict(as_sequence(scale(X_all[new_idx])), verbose=0)[:, :1]
+        actual = y_all[new_idx].reshape(len(new_idx), -1)[:, :1]
+        pre_update_rmse = float(np.sqrt(mean_squared_error(actual, scaler.inverse_transform(before))))
+        if pre_update_rmse > DL_DRIFT_ERROR_RATIO * previous['rmse']:
+            return None, 'error drift'
         
-    future_predictions = scaler.inverse_transform(np.array(future_predictions).reshape(-1, 1))
+        replay_idx = np.random.default_rng().choice(
+            training_size, size=min(DL_REPLAY_SIZE, training_size), replace=False)
+        idx = np.concatenate([new_idx, np.sort(replay_idx)])
+        model.fit(as_sequence(scale(X_all[idx])), scale(y_all[idx]),
+                  batch_size=dl_fit_settings(model_type, params)[0], epochs=DL_FINE_TUNE_EPOCHS, verbose=0)
+    
+    with stage('test_predict'):
+        predictions = model.predict(as_sequence(scale(X_all[training_size:])), verbose=0)[:, :1]
+    predictions = scaler.inverse_transform(predictions)
+    y_test = y_all[training_size:].reshape(n - training_size, -1)[:, :1]
+    # The update trained on the new bars, so they are left out of the RMSE (it is the
+    # baseline of the next drift check); with nothing else left, use the pre-update error
+    unseen = max(0, new_idx[0] - training_size)
+    if unseen:
+        rmse = float(np.sqrt(mean_squared_error(y_test[:unseen], predictions[:unseen])))
+    else:
+        rmse = pre_update_rmse
+    
+    return {
+        'model': model,
+        'scaler': scaler,
+        'horizon': horizon,
+        'params': params,
+        'predictions': predictions,
+        'rmse': rmse,
+        'test_start_idx': look_back + training_size,
+        'trained_until': df.index[-1].strftime('%Y-%m-%d'),
+        'trained_tail': _series_tail(df),
+        'full_trained_at': previous['full_trained_at'],
+        'updates': previous.get('updates', 0) + 1,
+        'update': {'mode': 'fine_tune', 'new_bars': new_bars, 'revised_bars': revised, 'replay': len(replay_idx),
+                   'pre_update_rmse': pre_update_rmse, 'rescaled': bool((new_lo, new_hi) != (lo, hi))},
+    }, None
+
+def forecast_dl_model(entry, df, look_back, forecast_days):
+    model, scaler = entry['model'], entry['scaler']
+    last_window = scaler.transform(df['Close'].values[-look_back:].astype(WINDOW_DTYPE).reshape(-1, 1)).reshape(-1)
     
-    return predictions, future_predictions, rmse, look_back + training_size
+    if entry.get('horizon', 1) >= forecast_days > 1:
+        # Direct: every forecast day from a single forward pass
+        outputs = keras_infer(model, last_window.reshape(1, look_back, 1))[0, :forecast_days]
+    else:
+        outputs = recursive_forecast(
+            lambda window: keras_infer(model, window.reshape(1, look_back, 1))[0, 0],
+            last_window, forecast_days
+        )
+        
+    return scaler.inverse_transform(outputs.reshape(-1, 1))
+
+def run_dl_model(df, look_back, forecast_days, model_type='lstm', forecast_mode='recursive'):
+    horizon = forecast_days if forecast_mode == 'direct' else 1
+    entry = train_dl_model(df, look_back, model_type, horizon)
+    future_predictions = forecast_dl_model(entry, df, look_back, forecast_days)
+    return entry['predictions'], future_predictions, entry['rmse'], entry['test_start_idx']
 
 # --- Machine Learning Models ---
-def run_ml_model(df, look_back, forecast_days, model_type='linear'):
-    X, y = prepare_flat_data(df, look_back)
+def build_ml_model(model_type, horizon=1, n_jobs=None, params=None):
+    """Untrained Linear/RandomForest/XGBoost estimator, n_jobs defaults to the process thread budget"""
+    backend = get_backend(model_type)
+    params = model_params(model_type, params)
+    n_jobs = n_jobs or thread_budget()
+    if model_type == 'linear':
+        model = backend.LinearRegression()
+    elif model_type == 'random_forest':
+        model = backend.RandomForestRegressor(n_estimators=params['n_estimators'], max_depth=params['max_depth'],
+                                              random_state=42, n_jobs=n_jobs)
+    elif model_type == 'xgboost':
+        # None leaves XGBoost's own default in place
+        model = backend.xgb.XGBRegressor(objective='reg:squarederror', n_estimators=params['n_estimators'],
+                                         max_depth=params['max_depth'], learning_rate=params['learning_rate'],
+                                         seed=42, n_jobs=n_jobs)
+        if horizon > 1:
+            model = backend.MultiOutputRegressor(model)
+    return model
+
+def train_ml_model(df, look_back, model_type='linear', horizon=1, params=None, prepared=None):
+    """
+    Fits a Linear/RandomForest/XGBoost model and scores it on the last 20%. Returns a registry entry.
+    horizon > 1 fits one output per forecast day (MultiOutputRegressor for XGBoost).
+    """
+    from sklearn.metrics import mean_squared_error
+    with stage('windowing'):
+        X, y = prepared or prepare_flat_data(df, look_back, horizon)
     training_size = int(len(X) * 0.8)
     X_train, X_test = X[:training_size], X[training_size:]
     y_train, y_test = y[:training_size], y[training_size:]
     
-    if model_type == 'linear':
-        model = LinearRegression()
-    elif model_type == 'random_forest':
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-    elif model_type == 'xgboost':
-        model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=100, seed=42)
+    params = model_params(model_type, params)
+    model = build_ml_model(model_type, horizon, params=params)
         
-    model.fit(X_train, y_train)
+    start = time.perf_counter()
+    with stage('fit'):
+        model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
     
-    predictions = model.predict(X_test)
-    mse = mean_squared_error(y_test, predictions)
+    # Test metrics use the next-day output so recursive and direct runs are comparable
+    with stage('test_predict'):
+        predictions = model.predict(X_test).reshape(len(X_test), -1)[:, :1]
+    mse = mean_squared_error(y_test.reshape(len(y_test), -1)[:, :1], predictions)
     rmse = np.sqrt(mse)
     
-    # Future
-    curr_sequence = df['Close'].values[-look_back:]
-    future_predictions = []
+    return {
+        'model': model,
+        'horizon': horizon,
+        'params': params,
+        'predictions': predictions,
+        'rmse': float(rmse),
+        'test_start_idx': look_back + training_size,
+        'training': {'fit_seconds': round(fit_seconds, 4)},
+    }
+
+def forecast_ml_model(entry, df, look_back, forecast_days):
+    model = entry['model']
+    last_window = df['Close'].values[-look_back:].astype(WINDOW_DTYPE)
     
-    for _ in range(forecast_days):
+    if entry.get('horizon', 1) >= forecast_days > 1:
+        # Direct: every forecast day from a single predict call
+        outputs = model.predict(last_window.reshape(1, -1)).reshape(-1)[:forecast_days]
+    else:
         # Reshape for prediction (1 sample, look_back features)
-        next_pred = model.predict(curr_sequence.reshape(1, -1))
-        val = next_pred[0]
-        future_predictions.append(val)
-        # Update sequence: remove first, add new prediction
-        curr_sequence = np.append(curr_sequence[1:], val)
+        outputs = recursive_forecast(
+            lambda window: model.predict(window.reshape(1, -1))[0],
+            last_window, forecast_days
+        )
         
-    return predictions.reshape(-1, 1), np.array(future_predictions).reshape(-1, 1), rmse, look_back + training_size
+    return np.asarray(outputs).reshape(-1, 1)
+
+def run_ml_model(df, look_back, forecast_days, model_type='linear', forecast_mode='recursive'):
+    horizon = forecast_days if forecast_mode == 'direct' else 1
+    entry = train_ml_model(df, look_back, model_type, horizon)
+    future_predictions = forecast_ml_model(entry, df, look_back, forecast_days)
+    return entry['predictions'], future_predictions, entry['rmse'], entry['test_start_idx']
+
+def get_trained_model(ticker, df, look_back, model_type, horizon=1, params=None, prepared=None):
+    """Returns (entry, cached) serving from the model registry when the same data was already trained on"""
+    params = model_params(model_type, params)
+    with stage('registry_lookup'):
+        key = make_key(ticker, model_type, look_back, df, horizon, params_tag(params, DEFAULT_PARAMS[model_type]))
+        entry = registry.get(key)
+    if entry is not None:
+        return entry, True
+    if model_type in DL_MODELS:
+        entry, reason = None, None
+        if DL_FINE_TUNE:
+            # A new bar changes the fingerprint; start from the model of the previous day instead of scratch
+            with stage('registry_previous'):
+                previous = registry.latest(key)
+            if previous is not None:
+                entry, reason = fine_tune_dl_model(previous, df, look_back, model_type)
+        if entry is None:
+            entry = train_dl_model(df, look_back, model_type, horizon, params, prepared)
+            if reason:
+                entry['update'] = {'mode': 'full', 'reason': reason}
+    else:
+        entry = train_ml_model(df, look_back, model_type, horizon, params, prepared)
+    with stage('registry_store'):
+        registry.put(key, entry)
+    return entry, False
+
+# --- Ensemble ---
+ENSEMBLE_MEMBERS = tuple(m.strip() for m in os.getenv('ENSEMBLE_MEMBERS', ','.join(MODEL_TYPES)).split(',') if m.strip())
+
+def _run_member(ticker, df, look_back, model_type, horizon, forecast_days, prepared, threads):
+    start = time.perf_counter()
+    try:
+        with thread_limit(threads):
+            entry, cached = get_trained_model(ticker, df, look_back, model_type, horizon, prepared=prepared)
+            train_seconds = time.perf_counter() - start
+            if model_type in DL_MODELS:
+                future = forecast_dl_model(entry, df, look_back, forecast_days)
+            else:
+                future = forecast_ml_model(entry, df, look_back, forecast_days)
+    except Exception as e:
+        print(f"Error training ensemble member {model_type}: {e}")
+        return {'error': str(e), 'seconds': round(time.perf_counter() - start, 4)}
+    return {
+        'entry': entry,
+        'future': np.asarray(future, dtype=np.float64).reshape(-1),
+        'cached_model': cached,
+        'train_seconds': round(train_seconds, 4),
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+def run_ensemble(ticker, df, look_back, forecast_days, horizon=1, members=ENSEMBLE_MEMBERS):
+    """
+    Trains the member models side by side on windows built once, and combines their
+    forecasts weighted by inverse test MSE. Returns an entry-like dict (predictions,
+    rmse, test_start_idx) plus future_predictions and a per-member breakdown.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    members = [m for m in members if m in MODEL_TYPES]
+    # Shared by every member: flat windows are strided views, and LSTM/GRU use one scaled copy
+    prepared = {}
+    if any(m not in DL_MODELS for m in members):
+        prepared['flat'] = prepare_flat_data(df, look_back, horizon)
+    if any(m in DL_MODELS for m in members):
+        try:
+            prepared['sequence'] = prepare_sequence_data(df, look_back, horizon)
+        except Exception as e:
+            print(f"Error preparing sequence data: {e}")
+    
+    # Split the cores between the members that multi-thread (linear is cheap)
+    heavy = [m for m in members if m != 'linear']
+    threads = max(1, (thread_budget() or cpu_count()) // max(1, len(heavy)))
+    with ThreadPoolExecutor(max_workers=max(1, len(members)), thread_name_prefix='ensemble') as pool:
+        futures = {
+            m: pool.submit(_run_member, ticker, df, look_back, m, horizon, forecast_days,
+                           prepared.get('sequence' if m in DL_MODELS else 'flat'), threads)
+            for m in members
+        }
+        results = {m: f.result() for m, f in futures.items()}
+    
+    trained = {m: r for m, r in results.items() if 'error' not in r}
+    if not trained:
+        return {'error': 'Every ensemble member failed: ' + '; '.join(f"{m}: {r['error']}" for m, r in results.items())}
+    
+    # Inverse-MSE weights; members share look_back and horizon, so their test splits line up
+    inverse = {m: 1.0 / max(r['entry']['rmse'], 1e-9) ** 2 for m, r in trained.items()}
+    total = sum(inverse.values())
+    weights = {m: v / total for m, v in inverse.items()}
+    predictions = sum(weights[m] * np.asarray(r['entry']['predictions'], dtype=np.float64).reshape(-1, 1) for m, r in trained.items())
+    future = sum(weights[m] * r['future'] for m, r in trained.items())
+    test_start_idx = next(iter(trained.values()))['entry']['test_start_idx']
+    actual = df['Close'].values[test_start_idx:test_start_idx + len(predictions)]
+    rmse = float(np.sqrt(np.mean((predictions.reshape(-1) - actual) ** 2)))
+    
+    breakdown = {}
+    for m, r in results.items():
+        if 'error' in r:
+            breakdown[m] = {'error': r['error'], 'seconds': r['seconds']}
+            continue
+        breakdown[m] = {
+            'weight': weights[m],
+            'rmse': r['entry']['rmse'],
+            'future_predictions': r['future'].tolist(),
+            'cached_model': r['cached_model'],
+            'train_seconds': r['train_seconds'],
+            'seconds': r['seconds'],
+        }
+    return {
+        'predictions': predictions,
+        'rmse': rmse,
+        'test_start_idx': test_start_idx,
+        'future_predictions': future.reshape(-1, 1),
+        'cached': all(r['cached_model'] for r in trained.values()),
+        'members': breakdown,
+        'params': {},
+    }
 
 # Main Dispatcher
-def train_and_predict(ticker, look_back=60, forecast_days=5, model_type='lstm'):
-    df = get_stock_data(ticker)
+FORECAST_MODES = ('recursive', 'direct')
+# Adds per-stage RSS readings to the timings block (costs a /proc read per stage)
+PREDICT_SAMPLE_MEMORY = os.getenv('PREDICT_SAMPLE_MEMORY', '0') == '1'
+
+def train_and_predict(ticker, look_back=60, forecast_days=5, model_type='lstm', forecast_mode='recursive',
+                      tuned=False, budget=None, progress=None):
+    # forecast_mode: 'recursive' feeds one-step predictions back in, 'direct' trains a model
+    # that outputs all forecast_days at once
+    # tuned: use the look_back and hyperparameters of the ticker's last sweep when there is one
+    # budget: target seconds for the whole run; cheaper settings or models are used to stay inside it
+    # progress is an optional callback that receives the name of each stage as it starts
+    progress = progress or (lambda stage: None)
+    if model_type not in MODEL_TYPES and model_type != 'ensemble':
+        return {'error': f"Unknown model type '{model_type}'."}
+    if forecast_mode not in FORECAST_MODES:
+        return {'error': f"Unknown forecast mode '{forecast_mode}'."}
+    
+    status = 'exception'
+    start = time.perf_counter()
+    with StageTimer(model=model_type, sample_memory=PREDICT_SAMPLE_MEMORY) as timer:
+        try:
+            result = _run_pipeline(ticker, look_back, forecast_days, model_type, forecast_mode, tuned,
+                                   budget if budget is not None else PREDICT_BUDGET_SECONDS, progress)
+            status = 'error' if 'error' in result else 'ok'
+        finally:
+            predict_seconds.observe(time.perf_counter() - start, model=model_type, status=status)
+    result['timings'] = timer.to_dict()
+    return result
+
+def _budget_params(model_type, params):
+    """params as the cost model should see them: LSTM/GRU with the epochs fit_dl_model will really run"""
+    if model_type not in DL_MODELS:
+        return params
+    return dict(params, epochs=dl_fit_settings(model_type, params)[1])
+
+def _plan_within_budget(ticker, df, look_back, model_type, horizon, forecast_days, params, budget):
+    """Returns (model_type, params, previous_entry, report) for the run that fits the budget"""
+    n_windows = window_count(len(df), look_back, horizon)
+    if model_type == 'ensemble':
+        # Members train side by side on the same cores, so their costs add up; the shared
+        # overhead is paid once. Cheapest members are kept first.
+        costs = {}
+        for member in ENSEMBLE_MEMBERS:
+            member_params = _budget_params(member, model_params(member))
+            cached = registry.get(make_key(ticker, member, look_back, df, horizon)) is not None
+            costs[member] = cost_model.estimate(member, n_windows, look_back, forecast_days,
+                                                member_params, cached) - BASE_OVERHEAD_SECONDS
+        members, total = [], BASE_OVERHEAD_SECONDS
+        for member in sorted(costs, key=costs.get):
+            if total + costs[member] > budget:
+                break
+            members.append(member)
+            total += costs[member]
+        # Keep the configured member order
+        members = [m for m in ENSEMBLE_MEMBERS if m in members]
+        if members:
+            degraded = None if len(members) == len(ENSEMBLE_MEMBERS) else 'fewer_members'
+            return 'ensemble', members, None, {'degraded': degraded, 'estimated_seconds': round(total, 3)}
+        return 'linear', {}, None, {'degraded': 'fallback_linear'}
+    
+    params = model_params(model_type, params)
+    key_for = lambda p: make_key(ticker, model_type, look_back, df, horizon, params_tag(p, DEFAULT_PARAMS[model_type]))
+    cached = registry.get(key_for(params)) is not None
+    decision = plan_budget(model_type, _budget_params(model_type, params), n_windows, look_back, forecast_days,
+                           budget, cached=cached)
+    if decision['degraded'] is None:
+        # Fits as requested; keep the requested params (and so its registry key)
+        decision['params'] = params
+    else:
+        # A capped model already trained on this data only needs to forecast; use one
+        # unless it is smaller than the cap that would be trained now
+        planned = decision['params'] if decision['degraded'] == 'capped' else None
+        for capped in cap_steps(model_type, _budget_params(model_type, params)):
+            if registry.get(key_for(capped)) is not None:
+                estimate = cost_model.estimate(model_type, n_windows, look_back, forecast_days, capped, trained=True)
+                if estimate <= budget:
+                    decision = {'model_type': model_type, 'params': capped,
+                                'estimated_seconds': estimate, 'degraded': 'capped'}
+                    break
+            if capped == planned:
+                break
+    previous = None
+    if decision['degraded'] == 'fallback_linear':
+        # Only look for an older model (possibly loading it from disk) when nothing else fits
+        previous = registry.latest(key_for(params))
+        if previous is not None:
+            decision = plan_budget(model_type, _budget_params(model_type, params), n_windows, look_back,
+                                   forecast_days, budget, cached=cached, has_previous=True)
+            decision['params'] = params
+    report = {'degraded': decision['degraded'], 'estimated_seconds': round(decision['estimated_seconds'], 3)}
+    return decision['model_type'], decision['params'], previous, report
+
+def _run_pipeline(ticker, look_back, forecast_days, model_type, forecast_mode, tuned, budget, progress):
+    progress('fetching')
+    with stage('fetch'):
+        df = get_stock_data(ticker)
     if df is None:
         return {'error': 'Could not fetch data.'}
     
-    dates = df.index.strftime('%Y-%m-%d').tolist()
-    close_prices = df['Close'].values.tolist()
+    params = None
+    best = load_best_config(ticker, model_type) if tuned else None
+    if best:
+        look_back, params = best['look_back'], best['params']
+    
+    progress('training')
+    horizon = forecast_days if forecast_mode == 'direct' else 1
+    requested_model, previous, budget_report = model_type, None, None
+    members = ENSEMBLE_MEMBERS
+    if budget:
+        with stage('budget'):
+            model_type, planned, previous, budget_report = _plan_within_budget(
+                ticker, df, look_back, model_type, horizon, forecast_days, params, budget)
+        if model_type == 'ensemble':
+            members = planned
+        else:
+            params = planned
     
-    if model_type in ['lstm', 'gru']:
-        predictions, future_predictions, rmse, test_start_idx = run_dl_model(df, look_back, forecast_days, model_type)
+    if model_type == 'ensemble':
+        # Members train and forecast concurrently, so there is no separate forecasting stage
+        with stage('ensemble'):
+            entry = run_ensemble(ticker, df, look_back, forecast_days, horizon, members)
+        if 'error' in entry:
+            return {'error': entry['error']}
+        cached, future_predictions = entry['cached'], entry['future_predictions']
     else:
-        predictions, future_predictions, rmse, test_start_idx = run_ml_model(df, look_back, forecast_days, model_type)
+        if previous is not None:
+            # Over budget: serve the model trained on the previous version of the data
+            entry, cached = previous, True
+        else:
+            entry, cached = get_trained_model(ticker, df, look_back, model_type, horizon, params)
+        if not cached and 'training' in entry and entry.get('update', {}).get('mode', 'full') == 'full':
+            # Calibrate the cost model with the fit alone: backend imports, registry loads
+            # and saves are not part of what the fit rates describe
+            training = entry['training']
+            ran = dict(entry['params'], **({'epochs': training['epochs']} if model_type in DL_MODELS else {}))
+            cost_model.observe(model_type, window_count(len(df), look_back, horizon), look_back, ran,
+                               training['fit_seconds'])
+        progress('forecasting')
+        with stage('forecast'):
+            if model_type in DL_MODELS:
+                future_predictions = forecast_dl_model(entry, df, look_back, forecast_days)
+            else:
+                future_predictions = forecast_ml_model(entry, df, look_back, forecast_days)
+    predictions, rmse, test_start_idx = entry['predictions'], entry['rmse'], entry['test_start_idx']
         
-    test_dates = dates[test_start_idx:]
-    
-    last_date = datetime.datetime.strptime(dates[-1], '%Y-%m-%d')
-    future_dates = []
-    current_date = last_date
-    for _ in range(forecast_days):
-        current_date += datetime.timedelta(days=1)
-        future_dates.append(current_date.strftime('%Y-%m-%d'))
-        
-    analysis = get_recommendation(df)
+    progress('analysing')
+    with stage('recommendation'):
+        analysis = get_recommendation(df, ticker)
     
-    return {
-        'ticker': ticker.upper(),
-        'model': model_type,
-        'dates': dates,
-        'actual_prices': close_prices,
-        'test_dates': test_dates,
-        'test_predictions': predictions.flatten().tolist(),
-        'future_dates': future_dates,
-        'future_predictions': future_predictions.flatten().tolist(),
-        'metrics': {'rmse': float(rmse)},
-        'summary': {
-            'look_back': look_back,
-            'forecast_days': forecast_days,
-            'last_date': dates[-1],
-            'last_predicted_date': future_dates[-1],
-            'last_predicted_price': float(future_predictions[-1][0])
-        },
-        'analysis': analysis
-    }
+    with stage('serialize'):
+        dates = df.index.strftime('%Y-%m-%d').tolist()
+        close_prices = df['Close'].values.tolist()
+        test_dates = dates[test_start_idx:test_start_idx + len(predictions)]
+        
+        last_date = datetime.datetime.strptime(dates[-1], '%Y-%m-%d')
+        future_dates = []
+        current_date = last_date
+        for _ in range(forecast_days):
+            current_date += datetime.timedelta(days=1)
+            future_dates.append(current_date.strftime('%Y-%m-%d'))
+        
+        result = {
+            'ticker': ticker.upper(),
+            'model': model_type,
+            'requested_model': requested_model,
+            'dates': dates,
+            'actual_prices': close_prices,
+            'test_dates': test_dates,
+            'test_predictions': predictions.flatten().tolist(),
+            'future_dates': future_dates,
+            'future_predictions': future_predictions.flatten().tolist(),
+            'metrics': {'rmse': float(rmse)},
+            'summary': {
+                'look_back': look_back,
+                'forecast_days': forecast_days,
+                'forecast_mode': forecast_mode,
+                'last_date': dates[-1],
+                'last_predicted_date': future_dates[-1],
+                'last_predicted_price': float(future_predictions[-1][0]),
+                'cached_model': cached,
+                'tuned': bool(best),
+                'params': entry.get('params', {}),
+                'model_update': entry.get('update'),
+                'training': entry.get('training')
+            },
+            'analysis': analysis
+        }
+        if 'members' in entry:
+            # Ensembles also report each member's forecast, weight and timing
+            result['members'] = entry['members']
+        if budget_report is not None:
+            result['summary']['budget'] = dict(budget_report, seconds=budget)
+        return result
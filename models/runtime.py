@@ -0,0 +1,81 @@
+import os
+import sys
+import contextvars
+from contextlib import contextmanager
+
+# Environment variables read by the native thread pools behind numpy/sklearn/xgboost/TF
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS',
+)
+
+_thread_budget = None
+_thread_limit = contextvars.ContextVar('thread_limit', default=None)
+
+
+def cpu_count():
+    """CPUs this process may run on (respects affinity masks / container limits where available)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_threads(threads):
+    """
+    Caps the threads every model backend may use in this process.
+    Call it before TensorFlow is imported where possible; if TF is already
+    loaded its thread pools are reconfigured on a best-effort basis.
+    """
+    global _thread_budget
+    threads = max(1, int(threads))
+    _thread_budget = threads
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(min(threads, 2))
+
+    if 'tensorflow' in sys.modules:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(min(threads, 2))
+        except RuntimeError:
+            # TF refuses once its runtime has been initialised
+            pass
+    return threads
+
+
+# TensorFlow thread pool sizes, applied when TF is first loaded
+# (0 = derive from the process thread budget, or TF's own default when there is none)
+DL_INTRA_OP_THREADS = int(os.getenv('DL_INTRA_OP_THREADS', '0'))
+DL_INTER_OP_THREADS = int(os.getenv('DL_INTER_OP_THREADS', '0'))
+
+
+def configure_tf_threads(tf):
+    """Applies DL_INTRA_OP_THREADS/DL_INTER_OP_THREADS; must run before TF executes its first op"""
+    intra = DL_INTRA_OP_THREADS or _thread_budget
+    inter = DL_INTER_OP_THREADS or (min(_thread_budget, 2) if _thread_budget else None)
+    try:
+        if intra:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+        if inter:
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        print(f"Error configuring TensorFlow threads: {e}")
+
+
+def thread_budget():
+    """n_jobs to hand to sklearn/xgboost estimators (None means library default)"""
+    return _thread_limit.get() or _thread_budget
+
+
+@contextmanager
+def thread_limit(threads):
+    """Lowers thread_budget() for estimators built in this thread, e.g. one of several trained side by side"""
+    token = _thread_limit.set(max(1, int(threads)))
+    try:
+        yield
+    finally:
+        _thread_limit.reset(token)
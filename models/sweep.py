@@ -0,0 +1,263 @@
+"""
+Hyperparameter sweeps over look_back and model settings.
+
+Configurations come from a grid or a random sample of a search space and are
+scored on the same validation bars (the most recent ones) whatever their
+look_back. Successive halving trains every configuration on a small slice of
+the training windows first and only lets the best 1/eta through to the next,
+larger rung, so most of the budget goes to promising settings.
+
+The close series is put in shared memory once; batch pool workers attach to it
+and take strided windows for each look_back straight from that buffer.
+
+    python -m models.sweep AAPL --model random_forest --search random --n-iter 30
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import as_completed
+
+from models.windows import build_windows, as_sequence, WINDOW_DTYPE
+from models.model_registry import DL_MODELS, data_fingerprint
+from models.backends import MODEL_TYPES
+
+SWEEP_DIR = os.getenv('SWEEP_DIR', os.path.join('data', 'sweeps'))
+# Bars at the end of the series every configuration is scored on
+SWEEP_VALIDATION_BARS = int(os.getenv('SWEEP_VALIDATION_BARS', '120'))
+# Saved results older than this are ignored when serving tuned predictions
+SWEEP_MAX_AGE_DAYS = float(os.getenv('SWEEP_MAX_AGE_DAYS', '30'))
+SEARCHES = ('grid', 'random')
+MIN_TRAIN_WINDOWS = 100
+
+SEARCH_SPACES = {
+    'lstm': {'look_back': [30, 60, 90, 120], 'units': [32, 50, 64], 'epochs': [3, 5, 10]},
+    'gru': {'look_back': [30, 60, 90, 120], 'units': [32, 50, 64], 'epochs': [3, 5, 10]},
+    'linear': {'look_back': [10, 20, 30, 60, 90, 120]},
+    'random_forest': {'look_back': [30, 60, 90], 'n_estimators': [50, 100, 200], 'max_depth': [None, 8, 16]},
+    'xgboost': {'look_back': [30, 60, 90], 'n_estimators': [100, 200, 400], 'max_depth': [3, 6],
+                'learning_rate': [0.05, 0.1, 0.3]},
+}
+
+
+def configurations(model_type, search='grid', n_iter=20, space=None, seed=0):
+    """Every combination of the search space ('grid') or n_iter distinct random ones"""
+    if search not in SEARCHES:
+        raise ValueError(f"Unknown search '{search}'.")
+    space = space or SEARCH_SPACES[model_type]
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    if search == 'random' and n_iter < len(grid):
+        grid = random.Random(seed).sample(grid, n_iter)
+    return grid
+
+
+# --- Shared price series ---
+class SharedSeries:
+    """A float32 copy of the close series in shared memory, unlinked on exit"""
+
+    def __init__(self, values):
+        values = np.ascontiguousarray(values, dtype=WINDOW_DTYPE)
+        self.length = len(values)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=WINDOW_DTYPE, buffer=self.shm.buf)[:] = values
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _split(n_windows, n_val, fraction):
+    """(train_start, train_end) of the most recent `fraction` of the training windows"""
+    train_end = n_windows - n_val
+    train_size = max(min(MIN_TRAIN_WINDOWS, train_end), int(train_end * fraction))
+    return train_end - train_size, train_end
+
+
+def _score(model_type, config, X, y, fraction, n_val):
+    from models.prediction_engine import build_dl_model, build_ml_model, fit_dl_model, model_params
+    params = model_params(model_type, {k: v for k, v in config.items() if k != 'look_back'})
+    train_start, train_end = _split(len(X), n_val, fraction)
+    X_train, y_train = X[train_start:train_end], y[train_start:train_end]
+    X_val, y_val = X[train_end:], y[train_end:]
+
+    start = time.perf_counter()
+    if model_type in DL_MODELS:
+        # Scaled on the training range only, the validation bars stay unseen
+        low = float(min(X_train.min(), y_train.min()))
+        scale = float(max(X_train.max(), y_train.max())) - low or 1.0
+        model = build_dl_model(model_type, config['look_back'], units=params['units'])
+        # Trained the way train_dl_model will train the winner
+        fit_dl_model(model, as_sequence((X_train - low) / scale), (y_train - low) / scale, model_type, params)
+        predicted = model.predict(as_sequence((X_val - low) / scale), batch_size=256, verbose=0).reshape(-1) * scale + low
+    else:
+        model = build_ml_model(model_type, params=params)
+        model.fit(X_train, y_train)
+        predicted = model.predict(X_val)
+    fit_seconds = time.perf_counter() - start
+    rmse = float(np.sqrt(np.mean((np.asarray(predicted, dtype=np.float64) - y_val) ** 2)))
+    return {'config': config, 'rmse': rmse, 'fit_seconds': round(fit_seconds, 4), 'train_windows': len(X_train)}
+
+
+def _score_shared(buf, length, model_type, config, fraction, n_val):
+    close = np.ndarray((length,), dtype=WINDOW_DTYPE, buffer=buf)
+    # Already float32 and contiguous, so the windows are views straight into shared memory
+    X, y = build_windows(close, config['look_back'])
+    # Validation targets are the same last n_val bars for every look_back
+    return _score(model_type, config, X, y, fraction, n_val)
+
+
+def _evaluate(shm_name, length, model_type, config, fraction, n_val):
+    """Runs in a pool worker: attaches to the shared series and scores one configuration"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        result = _score_shared(shm.buf, length, model_type, config, fraction, n_val)
+    except Exception as e:
+        result = {'config': config, 'error': str(e)}
+    # Closed only after the except block, when the views into shm.buf (held by the
+    # helper's frame and any traceback) are gone; close() refuses while they exist
+    try:
+        shm.close()
+    except BufferError as e:
+        print(f"Error detaching from shared series: {e}")
+    return result
+
+
+def _rungs(n_configs, eta):
+    """Training fractions from smallest to full, one rung per halving"""
+    count = max(1, math.ceil(math.log(max(n_configs, 1), eta)) + 1) if n_configs > 1 else 1
+    return [eta ** -(count - 1 - i) for i in range(count)]
+
+
+def run_sweep(ticker, model_type='linear', search='grid', n_iter=20, space=None, eta=3, seed=0,
+              workers=None, progress=None):
+    """
+    Successive-halving sweep for one ticker. The result (all rungs plus the winning
+    configuration) is saved under SWEEP_DIR and returned.
+    """
+    from models.prediction_engine import get_stock_data
+    from models.batch import get_pool
+    progress = progress or (lambda stage: None)
+    if model_type not in MODEL_TYPES:
+        return {'error': f"Unknown model type '{model_type}'."}
+    try:
+        configs = configurations(model_type, search, n_iter, space, seed)
+    except ValueError as e:
+        return {'error': str(e)}
+
+    progress('fetching')
+    df = get_stock_data(ticker)
+    if df is None:
+        return {'error': 'Could not fetch data.'}
+    max_look_back = max(c['look_back'] for c in configs)
+    n_val = min(SWEEP_VALIDATION_BARS, len(df) // 5)
+    if len(df) - max_look_back - n_val < MIN_TRAIN_WINDOWS:
+        return {'error': f"Not enough history for look_back {max_look_back}."}
+
+    start = time.perf_counter()
+    pool = get_pool(workers)
+    rungs = []
+    survivors = configs
+    with SharedSeries(df['Close'].values) as series:
+        fractions = _rungs(len(configs), eta)
+        for index, fraction in enumerate(fractions):
+            progress(f'rung {index + 1}/{len(fractions)}')
+            futures = [pool.submit(_evaluate, series.name, series.length, model_type, config, fraction, n_val)
+                       for config in survivors]
+            scored = [f.result() for f in as_completed(futures)]
+            failed = [r for r in scored if 'error' in r]
+            scored = sorted((r for r in scored if 'error' not in r), key=lambda r: r['rmse'])
+            rungs.append({'fraction': round(fraction, 4), 'results': scored, 'failed': failed})
+            if not scored:
+                return {'error': f"Every configuration failed: {failed[0]['error']}"}
+            keep = max(1, math.ceil(len(scored) / eta)) if index < len(fractions) - 1 else 1
+            survivors = [r['config'] for r in scored[:keep]]
+
+    best = rungs[-1]['results'][0]
+    result = {
+        'ticker': ticker.upper(),
+        'model': model_type,
+        'search': search,
+        'configurations': len(configs),
+        'validation_bars': n_val,
+        'data_fingerprint': data_fingerprint(df),
+        'best': {
+            'look_back': best['config']['look_back'],
+            'params': {k: v for k, v in best['config'].items() if k != 'look_back'},
+            'rmse': best['rmse'],
+        },
+        'rungs': rungs,
+        'elapsed': round(time.perf_counter() - start, 3),
+        'created_at': time.time(),
+    }
+    save_sweep(result)
+    return result
+
+
+# --- Persistence ---
+def _sweep_path(ticker, model_type):
+    safe = ticker.upper().replace('/', '_').replace('\\', '_')
+    return os.path.join(SWEEP_DIR, f"{safe}__{model_type}.json")
+
+
+def save_sweep(result):
+    path = _sweep_path(result['ticker'], result['model'])
+    try:
+        os.makedirs(SWEEP_DIR, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"Error saving sweep for {result['ticker']}: {e}")
+
+
+def load_best_config(ticker, model_type, max_age_days=SWEEP_MAX_AGE_DAYS):
+    """The best {'look_back', 'params', 'rmse'} from the last sweep, or None if there is no recent one"""
+    path = _sweep_path(ticker, model_type)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            result = json.load(f)
+    except Exception as e:
+        print(f"Error loading sweep for {ticker}: {e}")
+        return None
+    if max_age_days and time.time() - result.get('created_at', 0) > max_age_days * 86400:
+        return None
+    return result['best']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('ticker')
+    parser.add_argument('--model', default='linear', choices=MODEL_TYPES)
+    parser.add_argument('--search', default='grid', choices=SEARCHES)
+    parser.add_argument('--n-iter', type=int, default=20, help='configurations sampled by a random search')
+    parser.add_argument('--space', help='JSON search space, e.g. {"look_back": [30, 60], "n_estimators": [100, 300]}')
+    parser.add_argument('--eta', type=int, default=3, help='keep the best 1/eta of each rung')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    result = run_sweep(args.ticker, args.model, args.search, args.n_iter,
+                       json.loads(args.space) if args.space else None, args.eta, args.seed, args.workers,
+                       progress=lambda stage: print(stage, file=sys.stderr))
+    print(json.dumps(result.get('best', result), indent=2))
+
+
+if __name__ == '__main__':
+    main()
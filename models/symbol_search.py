@@ -0,0 +1,177 @@
+import os
+import csv
+import time
+import bisect
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+YAHOO_SEARCH_URL = 'https://query2.finance.yahoo.com/v1/finance/search'
+# Symbols learned from upstream are appended here and loaded again on startup
+SYMBOL_FILE = os.getenv('SYMBOL_FILE', os.path.join('data', 'symbols.csv'))
+# Answer locally when the index already has this many matches, an exact symbol match,
+# or any match for a query of at least SEARCH_LOCAL_MIN_QUERY characters
+SEARCH_LOCAL_MIN_RESULTS = int(os.getenv('SEARCH_LOCAL_MIN_RESULTS', '5'))
+SEARCH_LOCAL_MIN_QUERY = int(os.getenv('SEARCH_LOCAL_MIN_QUERY', '2'))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))
+SEARCH_CACHE_SIZE = 1024
+SEARCH_LIMIT = 10
+
+
+class SymbolIndex:
+    """
+    Prefix index over ticker symbols and company name words.
+    Keys live in a sorted list so a lookup is a bisect plus a short scan.
+    """
+
+    def __init__(self):
+        self.symbols = {}
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, symbol, name='N/A', exchange='N/A'):
+        """Adds a symbol, returns False if it was already known"""
+        symbol = symbol.strip()
+        if not symbol:
+            return False
+        with self._lock:
+            if symbol in self.symbols:
+                return False
+            self.symbols[symbol] = {'symbol': symbol, 'name': name or 'N/A', 'exchange': exchange or 'N/A'}
+            words = name.lower().split() if name and name != 'N/A' else []
+            tokens = {symbol.lower()} | set(words)
+            for token in tokens:
+                bisect.insort(self._keys, (token, symbol))
+            return True
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        query = query.strip().lower()
+        if not query:
+            return []
+        ranked = {}
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (query, ''))
+            for token, symbol in self._keys[start:]:
+                if not token.startswith(query):
+                    break
+                # Exact symbol first, then symbol prefixes, then name matches
+                if symbol.lower() == query:
+                    rank = 0
+                elif token == symbol.lower():
+                    rank = 1
+                else:
+                    rank = 2
+                ranked[symbol] = min(rank, ranked.get(symbol, rank))
+            ordered = sorted(ranked, key=lambda s: (ranked[s], len(s), s))
+            return [dict(self.symbols[s]) for s in ordered[:limit]]
+
+    def load(self, path):
+        """Loads symbol,name,exchange rows from a CSV file"""
+        if not path or not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if not row or row[0] == 'symbol':
+                    continue
+                row += ['N/A'] * (3 - len(row))
+                count += self.add(row[0], row[1], row[2])
+        return count
+
+
+class SymbolSearch:
+    """
+    Autocomplete backed by the local index, falling back to Yahoo Finance.
+    Upstream calls reuse one keep-alive session and are cached for a short TTL.
+    """
+
+    def __init__(self, index=None, symbol_file=SYMBOL_FILE, ttl=SEARCH_CACHE_TTL):
+        self.index = index or SymbolIndex()
+        self.symbol_file = symbol_file
+        self.ttl = ttl
+        self.local_hits = 0
+        self.cache_hits = 0
+        self.upstream_calls = 0
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        try:
+            self.index.load(symbol_file)
+        except Exception as e:
+            print(f"Error loading symbol file: {e}")
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        local = self.index.search(query, limit)
+        exact = bool(local) and local[0]['symbol'].lower() == query.strip().lower()
+        if (exact or len(local) >= min(SEARCH_LOCAL_MIN_RESULTS, limit)
+                or (local and len(query.strip()) >= SEARCH_LOCAL_MIN_QUERY)):
+            self.local_hits += 1
+            return local
+        upstream = self._search_upstream(query)
+        # Upstream order first (it ranks by popularity), then anything else we know
+        merged = OrderedDict((r['symbol'], r) for r in upstream)
+        for r in local:
+            merged.setdefault(r['symbol'], r)
+        return list(merged.values())[:limit]
+
+    def _search_upstream(self, query):
+        key = query.strip().lower()
+        now = time.time()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and now - cached[0] < self.ttl:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached[1]
+
+        self.upstream_calls += 1
+        try:
+            response = self.session.get(YAHOO_SEARCH_URL, params={'q': query}, timeout=5)
+            data = response.json()
+        except Exception as e:
+            print(f"Search error: {e}")
+            return []
+
+        results = []
+        if 'quotes' in data:
+            for quote in data['quotes']:
+                if 'symbol' in quote:
+                    results.append({
+                        'symbol': quote['symbol'],
+                        'name': quote.get('shortname', quote.get('longname', 'N/A')),
+                        'exchange': quote.get('exchange', 'N/A')
+                    })
+
+        with self._cache_lock:
+            self._cache[key] = (now, results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > SEARCH_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        self._learn(results)
+        return results
+
+    def _learn(self, results):
+        new = [r for r in results if self.index.add(r['symbol'], r['name'], r['exchange'])]
+        if not new or not self.symbol_file:
+            return
+        try:
+            with self._file_lock:
+                os.makedirs(os.path.dirname(self.symbol_file) or '.', exist_ok=True)
+                with open(self.symbol_file, 'a', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    for r in new:
+                        writer.writerow([r['symbol'], r['name'], r['exchange']])
+        except Exception as e:
+            print(f"Error saving symbols: {e}")
+
+
+symbol_search = SymbolSearch()
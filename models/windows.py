@@ -0,0 +1,35 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Windows are built in float32, which is what Keras trains in anyway
+WINDOW_DTYPE = np.float32
+
+
+def build_windows(values, look_back=60, dtype=WINDOW_DTYPE, horizon=1):
+    """
+    Returns (X, y) for a 1D series without copying the windows.
+    X is a read-only strided view of shape (n, look_back) where row i is
+    values[i:i + look_back]. With horizon=1, y[i] is values[i + look_back];
+    with a longer horizon y is a (n, horizon) view of the following bars.
+    """
+    values = np.ascontiguousarray(np.asarray(values).reshape(-1), dtype=dtype)
+    n = window_count(len(values), look_back, horizon)
+    if n <= 0:
+        raise ValueError(f"Need more than {look_back + horizon - 1} data points, got {len(values)}.")
+    # Windows without a full set of targets are dropped
+    X = sliding_window_view(values, look_back)[:n]
+    if horizon == 1:
+        y = values[look_back:]
+    else:
+        y = sliding_window_view(values[look_back:], horizon)
+    return X, y
+
+
+def as_sequence(X):
+    """Views flat (samples, look_back) windows as (samples, look_back, 1) for LSTM/GRU"""
+    return X[:, :, np.newaxis]
+
+
+def window_count(length, look_back, horizon=1):
+    """Number of (X, y) pairs a series of the given length produces"""
+    return max(length - look_back - horizon + 1, 0)
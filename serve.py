@@ -0,0 +1,96 @@
+"""
+Production server: preforking gunicorn workers with one thread budget each.
+
+    python serve.py                                   # SERVE_WORKERS workers on SERVE_BIND
+    SERVE_WORKERS=4 gunicorn --preload 'serve:create_app(preload=True)' -w 4 -k gthread --threads 16
+
+With the gunicorn command line, set SERVE_WORKERS to the -w count: create_app
+cannot see gunicorn's options and sizes the thread budgets from SERVE_WORKERS.
+
+The CPUs are split evenly between workers and each worker's TensorFlow,
+OpenMP/BLAS and sklearn/XGBoost pools are capped at its share, so the workers
+never run more compute threads between them than there are cores; inside a
+worker, the PREDICT_WORKERS jobs running at once split its sklearn/XGBoost
+share between them (see JobQueue). The app,
+the symbol index and the fork-safe model backends are loaded once in the
+master and shared copy-on-write; TensorFlow is only ever imported after the
+fork, in each worker.
+"""
+import os
+import sys
+
+from models.runtime import configure_threads, cpu_count
+
+SERVE_BIND = os.getenv('SERVE_BIND', '0.0.0.0:5000')
+# Worker processes (0 = one per CPU)
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', '0'))
+# Request threads per worker; predictions themselves run on the job queue,
+# but every open market stream holds one of these
+SERVE_REQUEST_THREADS = int(os.getenv('SERVE_REQUEST_THREADS', '16'))
+SERVE_TIMEOUT = int(os.getenv('SERVE_TIMEOUT', '300'))
+# Backends whose import starts no threads, so they can be loaded before fork
+FORK_SAFE_BACKENDS = ('linear', 'random_forest', 'xgboost')
+
+
+def gunicorn_layout(workers=None):
+    """Returns (gunicorn workers, threads_per_worker) so workers * threads never exceeds the CPU count"""
+    cpus = cpu_count()
+    workers = max(1, min(workers or SERVE_WORKERS or cpus, cpus))
+    return workers, max(1, cpus // workers)
+
+
+def create_app(workers=None, preload=False):
+    """
+    WSGI app factory. With preload=True it runs in the master before the workers
+    are forked: shared state is loaded here and each worker warms up its own
+    TensorFlow after the fork. Without it, it runs in every worker.
+    """
+    workers, threads = gunicorn_layout(workers)
+    # Before any model library is imported; forked workers inherit the limits
+    configure_threads(threads)
+    # A worker's batch pool only gets that worker's share of the cores: batch.worker_layout
+    # splits thread_budget() (set above) between its processes, one thread each by default
+    os.environ.setdefault('BATCH_WORKERS', str(threads))
+    # Market streams may use at most half the request threads, later viewers poll instead
+    os.environ.setdefault('MARKET_STREAM_MAX_CLIENTS', str(max(1, SERVE_REQUEST_THREADS // 2)))
+
+    import app as server
+    from models.backends import warm_up, MODEL_WARMUP
+    if preload:
+        requested = [t.strip() for t in MODEL_WARMUP.split(',') if t.strip()]
+        if 'all' in requested:
+            requested = FORK_SAFE_BACKENDS
+        warm_up([t for t in requested if t in FORK_SAFE_BACKENDS])
+        os.register_at_fork(after_in_child=server.start_warmup)
+    else:
+        server.start_warmup()
+    return server.app
+
+
+def main():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("Error: gunicorn is not installed (pip install gunicorn), or run python app.py for development.")
+        sys.exit(1)
+
+    workers, threads = gunicorn_layout()
+    application = create_app(workers, preload=True)
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', SERVE_BIND)
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', SERVE_REQUEST_THREADS)
+            self.cfg.set('timeout', SERVE_TIMEOUT)
+
+        def load(self):
+            return application
+
+    print(f"Serving on {SERVE_BIND} with {workers} workers x {threads} threads")
+    Server().run()
+
+
+if __name__ == '__main__':
+    main()
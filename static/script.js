@@ -2,11 +2,9 @@ let stockChart = null;
 
 // Load Market Watch on startup
 document.addEventListener('DOMContentLoaded', () => {
-    fetchMarketSummary();
+    subscribeMarketSummary();
     setupAutocomplete();
     updateModelOptions(); // Initialize model options based on default provider
-    // Refresh market data every 60 seconds
-    setInterval(fetchMarketSummary, 60000);
 });
 
 function debounce(func, wait) {
@@ -75,43 +73,82 @@ function setupAutocomplete() {
     });
 }
 
+// Latest quote per ticker, in the order the server first sent them
+const marketQuotes = new Map();
+let marketPollTimer = null;
+
+// Pushed updates over SSE; falls back to polling every 60 seconds when streaming is unavailable
+function subscribeMarketSummary() {
+    if (!window.EventSource) {
+        startMarketPolling();
+        return;
+    }
+    const source = new EventSource('/market-summary/stream');
+    source.addEventListener('snapshot', (e) => {
+        marketQuotes.clear();
+        mergeMarketQuotes(JSON.parse(e.data));
+    });
+    source.addEventListener('update', (e) => mergeMarketQuotes(JSON.parse(e.data)));
+    source.onerror = () => {
+        // CONNECTING means the browser is already retrying; CLOSED means the server refused (e.g. 503)
+        if (source.readyState === EventSource.CLOSED) {
+            startMarketPolling();
+        }
+    };
+}
+
+function startMarketPolling() {
+    if (marketPollTimer) return;
+    fetchMarketSummary();
+    marketPollTimer = setInterval(fetchMarketSummary, 60000);
+}
+
+function mergeMarketQuotes(quotes) {
+    quotes.forEach(item => marketQuotes.set(item.ticker, item));
+    renderMarketSummary(Array.from(marketQuotes.values()));
+}
+
 async function fetchMarketSummary() {
     const listContainer = document.getElementById('market-list');
     try {
         const response = await fetch('/market-summary');
         const data = await response.json();
-
-        listContainer.innerHTML = '';
-
-        data.forEach(item => {
-            const div = document.createElement('div');
-            div.className = 'market-item';
-            const changeClass = item.change >= 0 ? 'text-green' : 'text-red';
-            const sign = item.change >= 0 ? '+' : '';
-
-            div.innerHTML = `
-                <div class="market-item-header">
-                    <span class="ticker-symbol">${item.ticker}</span>
-                    <span class="ticker-price">$${item.price.toFixed(2)}</span>
-                </div>
-                <div class="ticker-change ${changeClass}">
-                    ${sign}${item.change.toFixed(2)} (${sign}${item.change_pct.toFixed(2)}%)
-                </div>
-            `;
-            // Click to populate input
-            div.style.cursor = 'pointer';
-            div.onclick = () => {
-                document.getElementById('ticker').value = item.ticker;
-            };
-
-            listContainer.appendChild(div);
-        });
+        renderMarketSummary(data);
     } catch (error) {
         console.error('Error fetching market summary:', error);
         listContainer.innerHTML = '<div style="text-align: center; color: var(--text-secondary);">Failed to load data.</div>';
     }
 }
 
+function renderMarketSummary(data) {
+    const listContainer = document.getElementById('market-list');
+    listContainer.innerHTML = '';
+
+    data.forEach(item => {
+        const div = document.createElement('div');
+        div.className = 'market-item';
+        const changeClass = item.change >= 0 ? 'text-green' : 'text-red';
+        const sign = item.change >= 0 ? '+' : '';
+
+        div.innerHTML = `
+            <div class="market-item-header">
+                <span class="ticker-symbol">${item.ticker}</span>
+                <span class="ticker-price">$${item.price.toFixed(2)}</span>
+            </div>
+            <div class="ticker-change ${changeClass}">
+                ${sign}${item.change.toFixed(2)} (${sign}${item.change_pct.toFixed(2)}%)
+            </div>
+        `;
+        // Click to populate input
+        div.style.cursor = 'pointer';
+        div.onclick = () => {
+            document.getElementById('ticker').value = item.ticker;
+        };
+
+        listContainer.appendChild(div);
+    });
+}
+
 async function predictPrice() {
     const ticker = document.getElementById('ticker').value.trim();
     const lookBack = document.getElementById('look_back').value;
@@ -138,7 +175,7 @@ async function predictPrice() {
     predictBtn.disabled = true;
 
     try {
-        const response = await fetch('/predict', {
+        const response = await fetch('/predict/jobs', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -151,12 +188,15 @@ async function predictPrice() {
             }),
         });
 
-        const data = await response.json();
+        const job = await response.json();
 
         if (!response.ok) {
-            throw new Error(data.error || 'An error occurred while fetching predictions.');
+            throw new Error(job.error || 'An error occurred while fetching predictions.');
         }
 
+        const cached = priceHistory[ticker.toUpperCase()];
+        const data = mergeHistory(await waitForPredictJob(job.job_id, cached && cached.dates[cached.dates.length - 1]));
+
         displayResults(data);
 
         // Store context for chat
@@ -180,6 +220,76 @@ async function predictPrice() {
     }
 }
 
+const PREDICT_STAGES = {
+    queued: 'Waiting for a free worker...',
+    fetching: 'Fetching market data...',
+    training: 'Training model and generating predictions...',
+    forecasting: 'Forecasting future prices...',
+    analysing: 'Running technical analysis...'
+};
+
+async function waitForPredictJob(jobId, since) {
+    const loadingText = document.querySelector('#loading p');
+    // Compact columnar result, and only the price history from our last bar on
+    const params = new URLSearchParams({ format: 'columnar' });
+    if (since) {
+        params.set('since', since);
+    }
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`/predict/jobs/${jobId}?${params}`);
+        const job = await response.json();
+
+        if (!response.ok || job.status === 'failed') {
+            throw new Error(job.error || 'An error occurred while fetching predictions.');
+        }
+        if (job.status === 'done') {
+            loadingText.textContent = PREDICT_STAGES.training;
+            return decodeColumnar(job.result);
+        }
+        loadingText.textContent = PREDICT_STAGES[job.stage || job.status] || PREDICT_STAGES.training;
+    }
+}
+
+// Historical closes per ticker, so repeat predictions only download new bars
+const priceHistory = {};
+
+function epochDayToDate(day) {
+    return new Date(day * 86400000).toISOString().slice(0, 10);
+}
+
+function decodeFloat32(data) {
+    const bytes = Uint8Array.from(atob(data), c => c.charCodeAt(0));
+    return Array.from(new Float32Array(bytes.buffer));
+}
+
+function decodeColumnar(result) {
+    if (result.format !== 'columnar') {
+        return result;
+    }
+    const pairs = [['dates', 'actual_prices'], ['test_dates', 'test_predictions'], ['future_dates', 'future_predictions']];
+    for (const [dateKey, valueKey] of pairs) {
+        result[dateKey] = result[dateKey].map(epochDayToDate);
+        result[valueKey] = decodeFloat32(result[valueKey]);
+    }
+    return result;
+}
+
+function mergeHistory(data) {
+    const cached = priceHistory[data.ticker];
+    if (data.delta && cached) {
+        // The delta starts at our last bar (inclusive), which may have been revised since
+        let keep = cached.dates.length;
+        while (keep > 0 && cached.dates[keep - 1] >= data.delta.since) {
+            keep--;
+        }
+        data.dates = cached.dates.slice(0, keep).concat(data.dates);
+        data.actual_prices = cached.prices.slice(0, keep).concat(data.actual_prices);
+    }
+    priceHistory[data.ticker] = { dates: data.dates, prices: data.actual_prices };
+    return data;
+}
+
 function showError(message) {
     const errorMsg = document.getElementById('error-msg');
     if (errorMsg) {
@@ -266,7 +376,7 @@ async function sendChatMessage() {
     }
 
     try {
-        const response = await fetch('/chat', {
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -277,15 +387,29 @@ async function sendChatMessage() {
             })
         });
 
-        const data = await response.json();
-        if (data.error) {
-            addMessage('system', 'Error: ' + data.error);
-            if (data.error.includes('API key') || data.error.includes('configure')) {
-                addMessage('system', 'Please configure your API key in Settings (⚙️ icon in header).');
-            }
-        } else {
-            addMessage('assistant', data.response);
+        if (!response.ok) {
+            const data = await response.json();
+            showChatError(data.error);
+            return;
         }
+
+        // Render tokens as they arrive instead of waiting for the full reply
+        let reply = '';
+        let bubble = null;
+        await readEventStream(response, (event) => {
+            if (event.error) {
+                showChatError(event.error.replace(/^Error: /, ''));
+            } else if (event.delta) {
+                reply += event.delta;
+                if (!bubble) {
+                    loadingIndicator.classList.add('hidden');
+                    bubble = addMessage('assistant', reply);
+                } else {
+                    renderAssistantMessage(bubble, reply);
+                    history.scrollTop = history.scrollHeight;
+                }
+            }
+        });
     } catch (error) {
         addMessage('system', 'Error communicating with server: ' + error.message);
     } finally {
@@ -296,6 +420,53 @@ async function sendChatMessage() {
     }
 }
 
+function showChatError(error) {
+    addMessage('system', 'Error: ' + error);
+    if (error.includes('API key') || error.includes('configure')) {
+        addMessage('system', 'Please configure your API key in Settings (⚙️ icon in header).');
+    }
+}
+
+// Parses a text/event-stream response body, calling onEvent with each JSON data payload
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            if (block.startsWith('event: done')) return;
+            const dataLine = block.split('\n').find(line => line.startsWith('data: '));
+            if (dataLine) {
+                onEvent(JSON.parse(dataLine.slice(6)));
+            }
+        }
+    }
+}
+
+function renderAssistantMessage(div, text) {
+    // Configure marked for safe HTML rendering
+    if (typeof marked !== 'undefined') {
+        marked.setOptions({
+            breaks: true,
+            gfm: true,
+            headerIds: false,
+            mangle: false
+        });
+        div.innerHTML = marked.parse(text);
+    } else {
+        // Fallback: simple markdown-like formatting if marked.js isn't loaded
+        div.innerHTML = formatSimpleMarkdown(text);
+    }
+}
+
 function addMessage(role, text) {
     const history = document.getElementById('chat-history');
     const div = document.createElement('div');
@@ -303,19 +474,7 @@ function addMessage(role, text) {
 
     // Parse and format markdown for assistant messages
     if (role === 'assistant') {
-        // Configure marked for safe HTML rendering
-        if (typeof marked !== 'undefined') {
-            marked.setOptions({
-                breaks: true,
-                gfm: true,
-                headerIds: false,
-                mangle: false
-            });
-            div.innerHTML = marked.parse(text);
-        } else {
-            // Fallback: simple markdown-like formatting if marked.js isn't loaded
-            div.innerHTML = formatSimpleMarkdown(text);
-        }
+        renderAssistantMessage(div, text);
     } else {
         // For user and system messages, use plain text (escape HTML)
         div.textContent = text;
@@ -323,6 +482,7 @@ function addMessage(role, text) {
 
     history.appendChild(div);
     history.scrollTop = history.scrollHeight;
+    return div;
 }
 
 function formatSimpleMarkdown(text) {
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from models.numpy_inference import export_keras, load_numpy_model
+from models.prediction_engine import build_dl_model
+
+LOOK_BACK = 12
+
+
+def _windows(samples=16, seed=0):
+    return np.random.default_rng(seed).random((samples, LOOK_BACK, 1), dtype=np.float32)
+
+
+def _assert_parity(model, tmp_path):
+    path = str(tmp_path / 'model.npz')
+    export_keras(model, path)
+    x = _windows()
+    expected = np.asarray(model(x, training=False))
+    assert np.allclose(load_numpy_model(path).predict(x), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize('model_type', ['lstm', 'gru'])
+@pytest.mark.parametrize('horizon', [1, 3])
+def test_served_models_match_keras(model_type, horizon, tmp_path):
+    tf.keras.utils.set_random_seed(0)
+    model = build_dl_model(model_type, LOOK_BACK, horizon=horizon, units=8)
+    _assert_parity(model, tmp_path)
+
+
+def test_gru_without_reset_after_matches_keras(tmp_path):
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.Input((LOOK_BACK, 1)),
+        tf.keras.layers.GRU(8, reset_after=False),
+        tf.keras.layers.Dense(1),
+    ])
+    _assert_parity(model, tmp_path)
+
+
+def test_trained_weights_match_keras(tmp_path):
+    # Fitted weights are not in the small range of a fresh initialisation
+    tf.keras.utils.set_random_seed(0)
+    model = build_dl_model('lstm', LOOK_BACK, units=8)
+    x = _windows(64, seed=1)
+    model.fit(x, x[:, -1, 0], epochs=2, verbose=0)
+    _assert_parity(model, tmp_path)